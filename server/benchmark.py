@@ -0,0 +1,478 @@
+"""
+Offline benchmark: replay a local image corpus through the face services.
+
+    # Every target over server/uploads, results saved for later comparison
+    python benchmark.py --json bench_$(git rev-parse --short HEAD).json
+    # Only the in-process upload path, 5 passes, 4 concurrent clients
+    python benchmark.py --targets upload-inprocess --repeat 5 --concurrency 4
+    # Compare against an earlier run; exits 1 when something regressed
+    python benchmark.py --json head.json --compare base.json
+
+Targets:
+    upload-inprocess  POST /upload-and-process through Flask's test client
+    upload-http       the same against a freshly started flask_app.py
+    count-inprocess   POST /count-students (yolo-service/app.py) through the test client
+    count-http        the same against a freshly started yolo-service
+
+Each target runs in its own child process with scratch upload/cache folders, so
+peak RSS is per target and the real uploads are never touched. Every upload gets
+unique trailing bytes, which decoders ignore, so the content-hash cache never
+answers. --warm-cache replays identical bytes to time the cache-hit path instead.
+count_students fetches from a local static HTTP stand-in (ImageStandIn).
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+YOLO_SERVICE_DIR = os.path.join(os.path.dirname(SERVER_DIR), 'yolo-service')
+TARGETS = ('upload-inprocess', 'upload-http', 'count-inprocess', 'count-http')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+# Long-side pixel bounds for the per-resolution breakdown
+RESOLUTION_BUCKETS = ((640, '<=640'), (1280, '<=1280'), (1920, '<=1920'), (3840, '<=3840'))
+# Config that changes what is being measured; recorded with every result
+CONFIG_ENV = ('INFERENCE_BACKEND', 'MODEL_PRECISION', 'INFERENCE_WORKERS', 'BATCH_MAX_SIZE', 'BATCH_MAX_WAIT_MS',
+              'REDUCED_DECODE', 'SLICED_INFERENCE', 'INFER_SIZE', 'SAVE_ORIGINALS')
+RESULT_MARKER = 'BENCH_RESULT '
+
+
+def resolution_bucket(width, height):
+    long_side = max(width, height)
+    for bound, name in RESOLUTION_BUCKETS:
+        if long_side <= bound:
+            return name
+    return f'>{RESOLUTION_BUCKETS[-1][0]}'
+
+
+def load_corpus(folder, limit=None):
+    """``[(name, bytes, bucket)]`` for the images in ``folder`` (annotated copies skipped)."""
+    corpus = []
+    for name in sorted(os.listdir(folder)):
+        if name.startswith('annotated_') or not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+        except OSError:
+            continue
+        with open(path, 'rb') as f:
+            corpus.append((name, f.read(), resolution_bucket(width, height)))
+        if limit and len(corpus) >= limit:
+            break
+    return corpus
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ImageStandIn:
+    """Local static HTTP server standing in for Firebase Storage.
+
+    Serves ``images`` (a list of bytes) at ``/<index>/<anything>``, with an ETag per
+    image and 304 answers to matching If-None-Match. ``latency_ms`` adds a fixed delay
+    per response to mimic remote storage.
+    """
+
+    def __init__(self, images, latency_ms=0):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                try:
+                    index = int(self.path.strip('/').split('/')[0])
+                    body = stand_in.images[index]
+                except (ValueError, IndexError):
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                etag = f'"img-{index}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.images = images
+        self.latency = latency_ms / 1000.0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, name='image-stand-in', daemon=True).start()
+
+    def url(self, index, tag=''):
+        return f'{self.base_url}/{index}/{tag or "image"}'
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_service(target, env):
+    """Start flask_app.py or yolo-service on a free port; returns ``(process, base_url)``."""
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    if target.startswith('upload'):
+        command, cwd = [sys.executable, 'flask_app.py'], SERVER_DIR
+    else:
+        # app.py's __main__ runs Flask's debug reloader (a second process); serve it directly
+        command = [sys.executable, '-c',
+                   'import os, app; app.app.run(host="127.0.0.1", port=int(os.environ["PORT"]), threaded=True)']
+        cwd = YOLO_SERVICE_DIR
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def wait_ready(base_url, process, timeout=300):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'Service exited with code {process.returncode} before becoming ready')
+        try:
+            if requests.get(f'{base_url}/health/ready', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{base_url} not ready after {timeout}s')
+
+
+def peak_rss_mb(pid=None):
+    """Peak resident set size in MB: this process, or ``pid`` via /proc (Linux only)."""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def make_sender(target, args, corpus, stand_in):
+    """Build ``send(index, tag) -> status`` for a target, plus the service process (if any)."""
+    process = None
+    if target.endswith('inprocess'):
+        service_dir = SERVER_DIR if target.startswith('upload') else YOLO_SERVICE_DIR
+        os.chdir(service_dir)
+        sys.path.insert(0, service_dir)
+        module = __import__('flask_app' if target.startswith('upload') else 'app')
+        while not module.boot['ready']:
+            if 'error' in module.boot:
+                raise RuntimeError(f"Model warm-up failed: {module.boot['error']}")
+            time.sleep(0.05)
+        client_app = module.app
+    else:
+        import requests
+        from requests.adapters import HTTPAdapter
+        process, base_url = start_service(target, os.environ)
+        wait_ready(base_url, process)
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=max(10, args.concurrency)))
+
+    def payload(index, tag):
+        name, data, _ = corpus[index]
+        return name, data if args.warm_cache else data + b'\0bench-' + tag.encode()
+
+    def image_url(index, tag):
+        # A stable URL per image lets the fetch cache revalidate; unique ones never hit it
+        return stand_in.url(index, '' if args.warm_cache else tag)
+
+    if target == 'upload-inprocess':
+        def send(index, tag):
+            name, data = payload(index, tag)
+            response = client_app.test_client().post(
+                f'/upload-and-process?response={args.response}',
+                data={'image': (BytesIO(data), name)}, content_type='multipart/form-data')
+            return response.status_code
+    elif target == 'upload-http':
+        def send(index, tag):
+            name, data = payload(index, tag)
+            response = session.post(f'{base_url}/upload-and-process', params={'response': args.response},
+                                    files={'image': (name, data)}, timeout=120)
+            return response.status_code
+    elif target == 'count-inprocess':
+        def send(index, tag):
+            response = client_app.test_client().post('/count-students', json={'imageUrl': image_url(index, tag)})
+            return response.status_code
+    else:
+        def send(index, tag):
+            response = session.post(f'{base_url}/count-students', json={'imageUrl': image_url(index, tag)},
+                                    timeout=120)
+            return response.status_code
+    return send, process
+
+
+def run_worker(target, args):
+    """Child process body: replay the corpus against one target and print its result."""
+    corpus = load_corpus(args.images, args.limit)
+    if not corpus:
+        raise SystemExit(f'No images found in {args.images}')
+
+    scratch = tempfile.mkdtemp(prefix='face-bench-')
+    # Fresh folders so nothing is served from (or written into) the real caches
+    os.environ.update({
+        'UPLOAD_FOLDER': os.path.join(scratch, 'uploads'),
+        'CACHE_FOLDER': os.path.join(scratch, 'cache'),
+        'INDEX_DB_PATH': os.path.join(scratch, 'uploads.db'),
+        'ANNOTATED_CACHE_FOLDER': os.path.join(scratch, 'annotated_cache'),
+        'FETCH_CACHE_FOLDER': os.path.join(scratch, 'fetch_cache'),
+        'FETCH_CACHE': '1' if args.warm_cache else '0'
+    })
+    stand_in = ImageStandIn([data for _, data, _ in corpus], args.storage_latency_ms) \
+        if target.startswith('count') else None
+    send, process = make_sender(target, args, corpus, stand_in)
+
+    try:
+        for i in range(args.warmup):
+            send(i % len(corpus), f'warmup-{i}')
+        if args.warm_cache:
+            # Prime the caches so every timed request is a hit
+            for index in range(len(corpus)):
+                send(index, 'prime')
+
+        jobs = [(index, f'{rep}-{index}') for rep in range(args.repeat) for index in range(len(corpus))]
+
+        def timed(job):
+            index, tag = job
+            start = time.perf_counter()
+            try:
+                status = send(index, tag)
+            except Exception as e:
+                status = type(e).__name__
+            return corpus[index][2], time.perf_counter() - start, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            samples = list(executor.map(timed, jobs))
+        elapsed = time.perf_counter() - started
+        server_rss = peak_rss_mb(process.pid) if process is not None else None
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if stand_in is not None:
+            stand_in.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    result = summarize(target, samples, elapsed)
+    result['peak_rss_mb'] = {'client': peak_rss_mb(), 'server': server_rss}
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+
+
+def latency_stats(latencies):
+    values = np.array(latencies) * 1000
+    if not len(values):
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2), 'mean_ms': round(float(values.mean()), 2)}
+
+
+def summarize(target, samples, elapsed):
+    ok = [(bucket, latency) for bucket, latency, status in samples if status == 200]
+    buckets = {}
+    order = [name for _, name in RESOLUTION_BUCKETS]
+    for bucket in sorted({bucket for bucket, _, _ in samples}, key=lambda b: order.index(b) if b in order else len(order)):
+        latencies = [latency for b, latency in ok if b == bucket]
+        buckets[bucket] = {'requests': len(latencies), **latency_stats(latencies)}
+    errors = {}
+    for _, _, status in samples:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    return {
+        'target': target,
+        'requests': len(samples),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        **latency_stats([latency for _, latency in ok]),
+        'buckets': buckets
+    }
+
+
+def run_target(target, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', target,
+               '--images', os.path.abspath(args.images), '--repeat', str(args.repeat),
+               '--concurrency', str(args.concurrency), '--warmup', str(args.warmup),
+               '--response', args.response, '--storage-latency-ms', str(args.storage_latency_ms)]
+    if args.limit:
+        command += ['--limit', str(args.limit)]
+    if args.warm_cache:
+        command.append('--warm-cache')
+    completed = subprocess.run(command, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    tail = '\n'.join((completed.stdout + completed.stderr).splitlines()[-15:])
+    print(f"❌ {target} failed (exit {completed.returncode}):\n{tail}")
+    return None
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SERVER_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_result(result):
+    rss = result['peak_rss_mb']
+    print(f"\n📊 {result['target']}: {result['throughput_rps']} img/s, p50 {result['p50_ms']} ms, "
+          f"p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, errors {sum(result['errors'].values())}, "
+          f"peak RSS client {rss['client']} MB / server {rss['server']} MB")
+    print(f"   {'resolution':>10} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for bucket, stats in result['buckets'].items():
+        if stats['requests']:
+            print(f"   {bucket:>10} {stats['requests']:5d} {stats['p50_ms']:9.1f} "
+                  f"{stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f}")
+
+
+def compare(baseline, current, threshold):
+    """Print per-metric changes vs ``baseline``; returns the regressions beyond ``threshold`` (%)."""
+    regressions = []
+
+    def check(label, old, new, higher_is_better=False):
+        if old in (None, 0) or new is None:
+            return
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = '⚠️ ' if worse > threshold else '  '
+        if worse > threshold:
+            regressions.append(label)
+        print(f"{flag}{label:48} {old:>10} -> {new:>10} ({change:+.1f}%)")
+
+    print(f"\n🔍 Compared with {baseline['meta'].get('commit') or 'baseline'} (threshold {threshold}%)")
+    for target, new in current['results'].items():
+        old = baseline['results'].get(target)
+        if not old or not new:
+            continue
+        check(f'{target} throughput_rps', old['throughput_rps'], new['throughput_rps'], higher_is_better=True)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(f'{target} {key}', old[key], new[key])
+        for bucket, stats in new['buckets'].items():
+            old_stats = old['buckets'].get(bucket)
+            if old_stats:
+                check(f'{target} [{bucket}] p95_ms', old_stats['p95_ms'], stats['p95_ms'])
+        check(f'{target} peak_rss_mb server', old['peak_rss_mb']['server'], new['peak_rss_mb']['server'])
+        check(f'{target} peak_rss_mb client', old['peak_rss_mb']['client'], new['peak_rss_mb']['client'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a local image corpus through the face services')
+    parser.add_argument('--images', default=os.path.join(SERVER_DIR, 'uploads'), help='corpus folder')
+    parser.add_argument('--limit', type=int, help='use at most this many images')
+    parser.add_argument('--targets', default=','.join(TARGETS), help=f"comma-separated: {', '.join(TARGETS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the corpus')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent client requests')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests before measuring')
+    parser.add_argument('--response', choices=['full', 'urls', 'bbox'], default='full',
+                        help='upload response mode')
+    parser.add_argument('--warm-cache', action='store_true', help='replay identical bytes (cache-hit path)')
+    parser.add_argument('--storage-latency-ms', type=float, default=0, help='delay added by the image stand-in')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='earlier results file to diff against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--worker', choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args)
+        return
+
+    targets = [t for t in args.targets.split(',') if t]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+
+    corpus = load_corpus(args.images, args.limit)
+    if not corpus:
+        raise SystemExit(f'No images found in {args.images}')
+    bucket_counts = {}
+    for _, _, bucket in corpus:
+        bucket_counts[bucket] = bucket_counts.get(bucket, 0) + 1
+    print(f"🖼️  {len(corpus)} images from {args.images}: {bucket_counts}")
+
+    commit, dirty = git_revision()
+    report = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'env': {key: os.environ.get(key) for key in CONFIG_ENV},
+            'args': {k: v for k, v in vars(args).items() if k not in ('worker', 'json', 'compare')},
+            'corpus': {'images': len(corpus), 'bytes': sum(len(d) for _, d, _ in corpus), 'buckets': bucket_counts}
+        },
+        'results': {}
+    }
+    for target in targets:
+        print(f"⏱️  Running {target}...")
+        result = run_target(target, args)
+        report['results'][target] = result
+        if result:
+            print_result(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n💾 Saved results to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed beyond {args.threshold}%")
+            sys.exit(1)
+        print("\n✅ No regressions beyond the threshold")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Check that an exported backend (ONNX / OpenVINO) matches the PyTorch model.
+
+Runs every original image in the uploads folder through both the ultralytics
+model and the candidate backend, matches boxes by IoU and reports per-image
+face-count and box differences. Exits non-zero if any image disagrees beyond
+the tolerances, so it can gate a model export.
+
+    python check_backend_parity.py --backend onnx
+    python check_backend_parity.py --backend openvino --images some/folder
+"""
+
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from inference import UltralyticsDetector, default_model_path, load_detector
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def iter_images(folder, limit=None):
+    names = sorted(n for n in os.listdir(folder)
+                   if n.lower().endswith(IMAGE_EXTENSIONS) and not n.startswith('annotated_'))
+    for name in names[:limit]:
+        image = cv2.imread(os.path.join(folder, name))
+        if image is not None:
+            yield name, image
+
+
+def box_iou(a, b):
+    """Pairwise IoU between two (N, 4) / (M, 4) xyxy arrays."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare(reference, candidate, match_iou):
+    """Greedy one-to-one matching; returns (matched, mean IoU, max confidence delta)."""
+    ref_boxes, ref_conf = reference
+    cand_boxes, cand_conf = candidate
+    ious = box_iou(ref_boxes, cand_boxes)
+    matched, match_ious, conf_deltas = 0, [], []
+    while ious.size and ious.max() >= match_iou:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        matched += 1
+        match_ious.append(float(ious[i, j]))
+        conf_deltas.append(abs(float(ref_conf[i]) - float(cand_conf[j])))
+        ious[i, :] = -1
+        ious[:, j] = -1
+    mean_iou = float(np.mean(match_ious)) if match_ious else 1.0
+    return matched, mean_iou, max(conf_deltas, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare an exported backend against the PyTorch model')
+    parser.add_argument('--backend', choices=['onnx', 'openvino'], default='onnx')
+    parser.add_argument('--reference-model', default='yolov8n-face.pt')
+    parser.add_argument('--model', help='exported model path (defaults to the export_model.py location)')
+    parser.add_argument('--images', default='uploads')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--match-iou', type=float, default=0.5, help='IoU for two boxes to count as the same face')
+    parser.add_argument('--min-mean-iou', type=float, default=0.9)
+    parser.add_argument('--max-count-delta', type=int, default=0)
+    args = parser.parse_args()
+
+    model_path = args.model or default_model_path(args.backend, args.reference_model)
+    reference = UltralyticsDetector(args.reference_model)
+    candidate = load_detector(args.backend, model_path)
+
+    failures = 0
+    print(f"{'image':60} {'ref':>4} {'cand':>4} {'match':>5} {'meanIoU':>8} {'maxΔconf':>8}")
+    for name, image in iter_images(args.images, args.limit):
+        ref = reference([image])[0]
+        cand = candidate([image])[0]
+        matched, mean_iou, conf_delta = compare(ref, cand, args.match_iou)
+        count_delta = abs(len(ref[0]) - len(cand[0]))
+        ok = count_delta <= args.max_count_delta and mean_iou >= args.min_mean_iou
+        failures += not ok
+        print(f"{name[:60]:60} {len(ref[0]):4d} {len(cand[0]):4d} {matched:5d} "
+              f"{mean_iou:8.3f} {conf_delta:8.3f} {'' if ok else '  ❌'}")
+
+    if failures:
+        print(f"❌ {failures} image(s) outside tolerance")
+        sys.exit(1)
+    print(f"✅ {args.backend} output matches the PyTorch model")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Export the PyTorch face model for the ONNX Runtime / OpenVINO inference backends.
+
+    python export_model.py --format onnx
+    python export_model.py --format openvino
+
+The exported files land next to the .pt model, where flask_app.py looks for them
+when INFERENCE_BACKEND is set (override with BACKEND_MODEL_PATH).
+"""
+
+import argparse
+
+from ultralytics import YOLO
+
+from inference import DEFAULT_IMGSZ, default_model_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the YOLOv8 face model for CPU runtimes')
+    parser.add_argument('--model', default='yolov8n-face.pt', help='PyTorch model to export')
+    parser.add_argument('--format', choices=['onnx', 'openvino'], default='onnx')
+    parser.add_argument('--imgsz', type=int, default=DEFAULT_IMGSZ, help='model input size')
+    parser.add_argument('--static-batch', action='store_true',
+                        help='export with a fixed batch of 1 instead of a dynamic batch axis')
+    args = parser.parse_args()
+
+    print(f"📦 Exporting {args.model} to {args.format} ({args.imgsz}px)...")
+    exported = YOLO(args.model).export(format=args.format, imgsz=args.imgsz,
+                                       dynamic=not args.static_batch, simplify=args.format == 'onnx')
+    print(f"✅ Exported to {exported}")
+    expected = default_model_path(args.format, args.model)
+    if args.format == 'onnx' and str(exported) != expected:
+        print(f"ℹ️  Set BACKEND_MODEL_PATH={exported} (default lookup is {expected})")
+
+
+if __name__ == '__main__':
+    main()
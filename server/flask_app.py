@@ -1,30 +1,663 @@
+import time
+BOOT_STARTED = time.perf_counter()  # boot timing covers the heavy imports below
+
 import os
 import cv2
 import base64
+import functools
+import hashlib
+import json
+import numpy as np
+import queue
+import random
+import sqlite3
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
-from ultralytics import YOLO
+from werkzeug.exceptions import HTTPException
+import requests
+from inference import BACKENDS, InferencePool, default_model_path, load_detector, parse_sizes, warm_up
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from profiling import ProfileStore, current_sampler, profile_call
+from io import BytesIO
+from PIL import Image
 import mimetypes
 import re
 
 # ---------------- CONFIG ----------------
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+CACHE_FOLDER = os.environ.get('CACHE_FOLDER', 'cache')            # detection results keyed by content hash
+INDEX_DB_PATH = os.environ.get('INDEX_DB_PATH', 'uploads.db')     # persistent index behind /list-uploads
+ANNOTATED_CACHE_FOLDER = os.environ.get('ANNOTATED_CACHE_FOLDER', 'annotated_cache')  # lazily rendered annotated images
+ANNOTATED_CACHE_MAX_BYTES = int(os.environ.get('ANNOTATED_CACHE_MAX_MB', 256)) * 1024 * 1024
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 MODEL_PATH = "yolov8n-face.pt"   # <-- change if your model is elsewhere
+# Inference backend: ultralytics (PyTorch), onnx or openvino -- see inference.py
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'ultralytics')
+# fp32, or int8 for a quantized onnx/openvino model built by quantize_model.py
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'fp32')
+BACKEND_MODEL_PATH = (os.environ.get('BACKEND_MODEL_PATH')
+                      or default_model_path(INFERENCE_BACKEND, MODEL_PATH, MODEL_PRECISION))
+SAVE_ORIGINALS = os.environ.get('SAVE_ORIGINALS', '1') != '0'  # keep a copy of each upload on disk
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))  # in-memory LRU entries
+
+# Response modes for /upload-and-process:
+#   full - bboxes, image URLs and the annotated image inline as base64 (default)
+#   urls - bboxes and image URLs only
+#   bbox - bboxes only; no annotated image is drawn or encoded
+RESPONSE_MODES = ('full', 'urls', 'bbox')
+
+# Model input size; large JPEGs are decoded at a reduced scale close to it (REDUCED_DECODE=0 disables)
+INFER_SIZE = int(os.environ.get('INFER_SIZE', 640))
+REDUCED_DECODE = os.environ.get('REDUCED_DECODE', '1') != '0'
+
+# Sliced inference for wide classroom photos: overlapping tiles + one full-frame pass, merged with NMS.
+#   off  - never (default); auto - when the long side is >= SLICE_MIN_SIDE. ?sliced=1/0 overrides per request.
+SLICED_INFERENCE = os.environ.get('SLICED_INFERENCE', 'off')
+SLICE_MIN_SIDE = int(os.environ.get('SLICE_MIN_SIDE', 1600))
+SLICE_SIZE = int(os.environ.get('SLICE_SIZE', 640))
+SLICE_OVERLAP = float(os.environ.get('SLICE_OVERLAP', 0.2))
+SLICE_NMS_IOU = float(os.environ.get('SLICE_NMS_IOU', 0.5))
+
+# Async jobs (/upload-and-process/async): bounded queue, 429 + Retry-After when full
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 64))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_TTL_S = int(os.environ.get('JOB_TTL_S', 3600))          # how long finished jobs stay pollable
+JOB_RETRY_AFTER_S = 5
+JOB_CALLBACK_TIMEOUT_S = 10
+
+# Bulk uploads (/upload-and-process/batch): many images or a zip in one request, NDJSON results
+BULK_MAX_FILES = int(os.environ.get('BULK_MAX_FILES', 100))
+BULK_MAX_CONTENT_LENGTH = int(os.environ.get('BULK_MAX_MB', 256)) * 1024 * 1024
+BULK_MAX_UNCOMPRESSED = int(os.environ.get('BULK_MAX_UNCOMPRESSED_MB', 512)) * 1024 * 1024  # images read into memory
+
+# Micro-batching: concurrent requests are grouped into one model call
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))         # max images per forward pass
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))  # max time to wait for a batch to fill
+
+# Inference worker processes, each with its own model pinned to a CPU slice (0 = run in this process)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+INFERENCE_TIMEOUT_S = float(os.environ.get('INFERENCE_TIMEOUT_S', 60))  # per pool batch; fails it after that
+
+# Warm-up: synthetic passes at these WxH sizes (plus one full batch) before /health/ready
+# reports ready; WARMUP=0 marks the server ready as soon as the model is loaded
+WARMUP = os.environ.get('WARMUP', '1') != '0'
+WARMUP_SIZES = parse_sizes(os.environ.get('WARMUP_SIZES', f'{INFER_SIZE}x{INFER_SIZE},1920x1080'))
+
+# Per-request profiling of /upload-and-process, off by default. PROFILE_REQUESTS=1 profiles
+# requests sent with "X-Profile: 1"; PROFILE_SAMPLE_RATE profiles that fraction of uploads.
+# Writes <id>.speedscope.json (request + inference-batch threads), <id>.batches.json + <id>.prof
+# to PROFILE_FOLDER, keeping the newest PROFILE_MAX_PROFILES
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') != '0'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', 'profiles')
+PROFILE_MAX_PROFILES = int(os.environ.get('PROFILE_MAX_PROFILES', 50))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 1))
+PROFILE_HEADER = 'X-Profile'
+
+# Retention for UPLOAD_FOLDER, off unless RETENTION_INTERVAL_MIN > 0. Each pass, cheapest tier first:
+#   1. drop annotated_ copies that can be re-rendered from the original + indexed boxes
+#   2. recompress originals not seen for RETENTION_RECOMPRESS_DAYS to RETENTION_FORMAT (<name>.webp/.jpg)
+#   3. hard-link byte-identical originals to a single copy
+#   4. delete uploads not seen for RETENTION_MAX_AGE_DAYS
+#   5. delete the least recently seen uploads until the folder is under RETENTION_MAX_MB
+# 0 disables a limit; RETENTION_DRY_RUN=1 only logs what a pass would reclaim
+RETENTION_INTERVAL_MIN = float(os.environ.get('RETENTION_INTERVAL_MIN', 0))
+RETENTION_RECOMPRESS_DAYS = float(os.environ.get('RETENTION_RECOMPRESS_DAYS', 30))
+RETENTION_FORMAT = os.environ.get('RETENTION_FORMAT', 'webp')     # webp or jpeg
+RETENTION_QUALITY = int(os.environ.get('RETENTION_QUALITY', 80))
+RETENTION_MAX_AGE_DAYS = float(os.environ.get('RETENTION_MAX_AGE_DAYS', 0))
+RETENTION_MAX_BYTES = int(float(os.environ.get('RETENTION_MAX_MB', 0)) * 1024 * 1024)
+RETENTION_DRY_RUN = os.environ.get('RETENTION_DRY_RUN', '0') != '0'
+RECOMPRESS_FORMATS = {'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY), 'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY)}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
+os.makedirs(ANNOTATED_CACHE_FOLDER, exist_ok=True)
 
 # ---------------- APP ----------------
+class UploadRequest(Request):
+    """Bulk uploads get a larger body limit; every other route keeps MAX_FILE_SIZE."""
+
+    @property
+    def max_content_length(self):
+        if self.path == '/upload-and-process/batch':
+            return BULK_MAX_CONTENT_LENGTH
+        return super().max_content_length
+
+boot = {'ready': False, 'timings': {'import_s': round(time.perf_counter() - BOOT_STARTED, 3)}}
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}})  # allow frontend
 
-# Load YOLOv8 face model
-print("📥 Loading YOLOv8 model...")
-model = YOLO(MODEL_PATH)
-print("✅ Model loaded")
+# ---------------- METRICS ----------------
+# Served as Prometheus text from /metrics; queue gauges are sampled at scrape time
+metrics = Registry()
+REQUESTS = metrics.counter('face_server_requests_total', 'HTTP requests by endpoint and status',
+                           ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = metrics.histogram('face_server_request_duration_seconds', 'HTTP request latency', ('endpoint',))
+IN_FLIGHT = metrics.gauge('face_server_requests_in_flight', 'Requests currently being handled')
+STAGE_SECONDS = metrics.histogram('face_server_stage_duration_seconds',
+                                  'Time spent per upload processing stage', ('stage',))
+INFERENCE_SECONDS = metrics.histogram('face_server_inference_duration_seconds', 'Model call time per batch')
+BATCH_SIZE = metrics.histogram('face_server_inference_batch_size', 'Images per model call',
+                               buckets=(1, 2, 4, 8, 16, 32, 64))
+metrics.gauge('face_server_inference_queue_depth', 'Image groups waiting for a model batch',
+              func=lambda: batcher.depth())
+metrics.gauge('face_server_inference_pending_batches', 'Batches sent to worker processes, not yet returned',
+              func=lambda: inference_pool.info()['pending_batches'] if inference_pool is not None else 0)
+metrics.gauge('face_server_job_queue_depth', 'Async upload jobs waiting for a worker',
+              func=lambda: job_queue.depth())
+RETENTION_RECLAIMED = metrics.counter('face_server_retention_reclaimed_bytes_total',
+                                      'Bytes freed in the upload folder by retention, by tier', ('tier',))
+RETENTION_RUN_SECONDS = metrics.histogram('face_server_retention_run_duration_seconds', 'Retention pass time',
+                                          buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900))
+metrics.gauge('face_server_ready', '1 once the model is loaded and warmed', func=lambda: int(boot['ready']))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    IN_FLIGHT.dec()
+
+# Load YOLOv8 face model, either here or in a pool of worker processes
+if INFERENCE_BACKEND not in BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {', '.join(BACKENDS)}, got {INFERENCE_BACKEND!r}")
+if RETENTION_FORMAT not in RECOMPRESS_FORMATS:
+    raise ValueError(f"RETENTION_FORMAT must be one of {', '.join(RECOMPRESS_FORMATS)}, got {RETENTION_FORMAT!r}")
+
+detector = None
+inference_pool = None
+if INFERENCE_WORKERS > 0 and not InferencePool.available():
+    print("⚠️  Inference worker pool needs the 'fork' start method; running in-process")
+    INFERENCE_WORKERS = 0
+
+if INFERENCE_WORKERS > 0:
+    print(f"📥 Starting {INFERENCE_WORKERS} inference worker processes ({INFERENCE_BACKEND})...")
+    # Each worker loads and warms its own model before reporting ready
+    inference_pool = InferencePool(INFERENCE_BACKEND, BACKEND_MODEL_PATH, INFERENCE_WORKERS,
+                                   WARMUP_SIZES if WARMUP else (), BATCH_MAX_SIZE, INFERENCE_TIMEOUT_S)
+    print("✅ Inference workers started")
+else:
+    print(f"📥 Loading YOLOv8 model ({INFERENCE_BACKEND})...")
+    model_load_started = time.perf_counter()
+    detector = load_detector(INFERENCE_BACKEND, BACKEND_MODEL_PATH)
+    boot['timings']['model_load_s'] = round(time.perf_counter() - model_load_started, 3)
+    print("✅ Model loaded")
+
+# ---------------- INFERENCE BATCHING ----------------
+class InferenceBatcher:
+    """Collects concurrent inference requests and runs them as one batched model call.
+
+    Requests wait for at most ``max_wait_ms`` (or until ``max_batch_size`` images
+    are queued) before the batch is handed to ``run_batch``; each caller gets back
+    its own ``(boxes_xyxy, confidences)`` pair. Up to ``max_in_flight`` batches
+    may run at once, which lets batches keep forming while workers are busy.
+    Images queued together with ``submit_many`` always share one model call.
+    Images queued from a profiled request carry its sampler, so the batch thread
+    is sampled while it runs them and the batch's timings land in that profile.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, max_in_flight=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max(1, max_in_flight)
+        self._queue = queue.Queue()
+        self._carry_over = None
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='inference-batch')
+        self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, source):
+        """Queue an image (ndarray) and return a Future for its detections."""
+        return self.submit_many([source])[0]
+
+    def submit_many(self, sources):
+        """Queue images as one group that is never split across model calls."""
+        group = [(source, Future()) for source in sources]
+        sampler = current_sampler()
+        if sampler is not None:
+            queued_at = time.perf_counter()
+            for _, future in group:
+                future.sampler, future.queued_at = sampler, queued_at
+        self._queue.put(group)
+        return [future for _, future in group]
+
+    def predict(self, source):
+        return self.submit(source).result()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def predict_many(self, sources):
+        return [future.result() for future in self.submit_many(sources)]
+
+    def _collect(self):
+        batch = list(self._next_group())
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                group = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if len(batch) + len(group) > self.max_batch_size:
+                # Doesn't fit: put it back at the head of the next batch
+                self._carry_over = group
+                break
+            batch.extend(group)
+        return batch
+
+    def _next_group(self):
+        group, self._carry_over = self._carry_over, None
+        return group if group is not None else self._queue.get()
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._collect()
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        profiled = {}  # sampler -> futures of that request in this batch
+        for _, future in batch:
+            sampler = getattr(future, 'sampler', None)
+            if sampler is not None:
+                profiled.setdefault(sampler, []).append(future)
+        thread_id = threading.get_ident()
+        for sampler in profiled:
+            sampler.attach(thread_id, 'inference-batch')
+        started = time.perf_counter()
+        try:
+            BATCH_SIZE.observe(len(batch))
+            detections, error = None, None
+            try:
+                with INFERENCE_SECONDS.time():
+                    detections = self.run_batch([source for source, _ in batch])
+            except Exception as e:
+                error = e
+            # Record before resolving the futures, which may end (and save) the profile
+            finished = time.perf_counter()
+            for sampler, futures in profiled.items():
+                sampler.detach(thread_id)
+                sampler.record_batch(
+                    thread=threading.current_thread().name,
+                    batch_size=len(batch),
+                    request_images=len(futures),
+                    queued_ms=round((started - min(f.queued_at for f in futures)) * 1000, 3),
+                    started_ms=round((started - sampler.started) * 1000, 3),
+                    run_ms=round((finished - started) * 1000, 3),
+                    error=None if error is None else str(error)
+                )
+            if error is not None:
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, detections):
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+if inference_pool is not None:
+    batcher = InferenceBatcher(inference_pool.run_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+                               max_in_flight=INFERENCE_WORKERS)
+else:
+    batcher = InferenceBatcher(detector, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+
+# ---------------- RESULT CACHE ----------------
+class ResultCache:
+    """Content-hash -> detection result cache: in-memory LRU backed by JSON files on disk."""
+
+    def __init__(self, folder, max_entries=1024):
+        self.folder = folder
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def _path(self, digest):
+        return os.path.join(self.folder, f"{digest}.json")
+
+    def _remember(self, digest, entry):
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.stats['memory_hits'] += 1
+                return entry
+
+        try:
+            with open(self._path(digest)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self._remember(digest, entry)
+            self.stats['disk_hits'] += 1
+        return entry
+
+    def put(self, digest, entry):
+        with self._lock:
+            self._remember(digest, entry)
+        # Unique temp name: identical uploads processed at once each write their own
+        tmp_path = f'{self._path(digest)}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(digest))
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def info(self):
+        with self._lock:
+            hits = self.stats['memory_hits'] + self.stats['disk_hits']
+            lookups = hits + self.stats['misses']
+            return {
+                **self.stats,
+                'hits': hits,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'entries_in_memory': len(self._entries),
+                'max_entries': self.max_entries
+            }
+
+result_cache = ResultCache(CACHE_FOLDER, RESULT_CACHE_SIZE)
+
+# ---------------- UPLOAD INDEX ----------------
+class UploadIndex:
+    """SQLite index of processed uploads, written at upload time and read by /list-uploads."""
+
+    # Sort field -> SQL expression (NULL-free so keyset comparisons stay well-defined)
+    SORT_COLUMNS = {
+        'uploaded_at': 'uploaded_at',
+        'last_seen_at': 'last_seen_at',
+        'size': 'COALESCE(size, -1)',
+        'face_count': 'COALESCE(face_count, -1)',
+        'filename': 'filename'
+    }
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    filename TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    annotated_filename TEXT,
+                    size INTEGER,
+                    uploaded_at TEXT,
+                    last_seen_at TEXT,
+                    upload_count INTEGER DEFAULT 1,
+                    face_count INTEGER,
+                    faces TEXT
+                )''')
+            for column in ('uploaded_at', 'last_seen_at', 'size', 'face_count'):
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_uploads_{column} ON uploads({column})')
+
+    def record(self, entry):
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT INTO uploads (filename, content_hash, annotated_filename, size,
+                                     uploaded_at, last_seen_at, face_count, faces)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(filename) DO UPDATE SET
+                    last_seen_at = excluded.last_seen_at,
+                    upload_count = upload_count + 1,
+                    face_count = excluded.face_count,
+                    faces = excluded.faces''',
+                (entry['filename'], entry['content_hash'], entry['annotated_filename'], entry.get('size'),
+                 now, now, len(entry['faces']), json.dumps(entry['faces'])))
+
+    def touch(self, filename):
+        """Note a repeated upload of an already indexed file."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE uploads SET last_seen_at = ?, upload_count = upload_count + 1 WHERE filename = ?',
+                (datetime.now().isoformat(), filename))
+
+    def _filters(self, since, until):
+        clauses, params = [], []
+        if since:
+            clauses.append('uploaded_at >= ?')
+            params.append(since)
+        if until:
+            clauses.append('uploaded_at <= ?')
+            params.append(until)
+        return clauses, params
+
+    def count(self, since=None, until=None):
+        """Matching rows; a full scan of the range, so only run when a client asks for it."""
+        clauses, params = self._filters(since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM uploads {where}', params).fetchone()[0]
+
+    def query(self, page=1, per_page=50, sort='uploaded_at', order='desc', since=None, until=None):
+        """OFFSET page; cost grows with the page number (``query_after`` does not)."""
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError(f'Unsupported sort column: {sort}')
+        key = self.SORT_COLUMNS[sort]
+        direction = 'ASC' if order == 'asc' else 'DESC'
+
+        clauses, params = self._filters(since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT * FROM uploads {where} ORDER BY {key} {direction}, filename {direction} LIMIT ? OFFSET ?',
+                params + [per_page, (page - 1) * per_page]).fetchall()
+        return [dict(row) for row in rows]
+
+    def query_after(self, after=None, limit=50, sort='uploaded_at', order='desc', since=None, until=None):
+        """Keyset page: rows strictly after the ``(sort_value, filename)`` pair ``after``.
+
+        Cost depends only on ``limit``, not on how deep into the listing the page is.
+        """
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError(f'Unsupported sort column: {sort}')
+        key = self.SORT_COLUMNS[sort]
+        direction, comparison = ('ASC', '>') if order == 'asc' else ('DESC', '<')
+
+        clauses, params = self._filters(since, until)
+        if after is not None:
+            clauses.append(f'({key}, filename) {comparison} (?, ?)')
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT *, {key} AS sort_key FROM uploads {where} ORDER BY {key} {direction}, filename {direction} LIMIT ?',
+                params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_rows(self, sort='uploaded_at', order='desc', since=None, until=None, chunk_size=500):
+        """Yield every matching row, fetching one keyset page at a time."""
+        after = None
+        while True:
+            rows = self.query_after(after, chunk_size, sort, order, since, until)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1]['sort_key'], rows[-1]['filename'])
+
+    def get(self, filename):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM uploads WHERE filename = ?', (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def set_faces(self, filename, content_hash, faces):
+        """Store detections for a row imported without them (see ``backfill``)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE uploads SET content_hash = COALESCE(content_hash, ?), face_count = ?, faces = ? '
+                'WHERE filename = ?', (content_hash, len(faces), json.dumps(faces), filename))
+
+    def delete(self, filename):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM uploads WHERE filename = ?', (filename,))
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM uploads LIMIT 1').fetchone() is None
+
+    def backfill(self, folder):
+        """One-off import of originals already on disk (detections unknown)."""
+        rows = []
+        with os.scandir(folder) as entries:
+            for item in entries:
+                if not item.is_file() or not allowed_file(item.name) or item.name.startswith('annotated_'):
+                    continue
+                stat = item.stat()
+                uploaded_at = datetime.fromtimestamp(stat.st_ctime).isoformat()
+                rows.append((item.name, f'annotated_{item.name}', stat.st_size, uploaded_at, uploaded_at))
+        with self._lock, self._conn:
+            self._conn.executemany('''
+                INSERT OR IGNORE INTO uploads (filename, annotated_filename, size, uploaded_at, last_seen_at)
+                VALUES (?, ?, ?, ?, ?)''', rows)
+        return len(rows)
+
+upload_index = UploadIndex(INDEX_DB_PATH)
+
+# ---------------- ANNOTATED IMAGE CACHE ----------------
+class AnnotatedImageCache:
+    """Size-bounded folder of rendered annotated images, evicted least-recently-used first."""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'renders': 0, 'evictions': 0}
+        self._render_locks = {}  # filename -> [lock, threads using it]
+
+        existing = []
+        with os.scandir(folder) as entries:
+            for item in entries:
+                if item.is_file():
+                    stat = item.stat()
+                    existing.append((stat.st_mtime, item.name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self._files[name] = size
+            self.total_bytes += size
+
+    def path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def lookup(self, filename):
+        """Return the cached path for ``filename`` (marking it recently used) or None."""
+        with self._lock:
+            if filename not in self._files:
+                return None
+            self._files.move_to_end(filename)
+            self.stats['hits'] += 1
+        return self.path(filename)
+
+    @contextmanager
+    def rendering(self, filename):
+        """Per-filename lock so concurrent first GETs render an image once and share it."""
+        with self._lock:
+            entry = self._render_locks.setdefault(filename, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._render_locks[filename]
+
+    def store(self, filename, image):
+        path = self.path(filename)
+        _, ext = os.path.splitext(filename)
+        ok, buffer = cv2.imencode(ext or '.jpg', image)
+        if not ok:
+            raise ValueError(f'Could not encode {filename}')
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        write_file(tmp_path, buffer.tobytes())
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.total_bytes += buffer.nbytes - self._files.pop(filename, 0)
+            self._files[filename] = buffer.nbytes
+            self.stats['renders'] += 1
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._files) > 1:
+                name, size = self._files.popitem(last=False)
+                self.total_bytes -= size
+                self.stats['evictions'] += 1
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+        return path
+
+    def discard(self, filename):
+        with self._lock:
+            self.total_bytes -= self._files.pop(filename, 0)
+        try:
+            os.remove(self.path(filename))
+        except OSError:
+            pass
+
+    def info(self):
+        with self._lock:
+            return {**self.stats, 'files': len(self._files), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
+
+annotated_cache = AnnotatedImageCache(ANNOTATED_CACHE_FOLDER, ANNOTATED_CACHE_MAX_BYTES)
+
+# Background writer so disk I/O stays off the request path
+io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+pending_originals = {}  # filename -> Future of its background write
+pending_originals_lock = threading.Lock()
+ORIGINAL_WRITE_WAIT_S = 10  # how long a GET waits for an original that is still being written
+# Bulk uploads: enough concurrent images to fill a model batch
+bulk_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_SIZE, thread_name_prefix='bulk-upload')
 
 # ---------------- HELPERS ----------------
 def allowed_file(filename):
@@ -33,116 +666,1142 @@ def allowed_file(filename):
 def secure_filename(filename):
     return re.sub(r'[^a-zA-Z0-9._-]', '_', filename)
 
-def generate_filename(original_filename):
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
-    name, ext = os.path.splitext(secure_filename(original_filename))
-    return f"{timestamp}_{name}{ext}"
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def generate_filename(original_filename, digest):
+    """Content-addressed name: identical uploads map to the same file."""
+    _, ext = os.path.splitext(secure_filename(original_filename))
+    return f"{digest[:32]}{ext.lower()}"
+
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2
+}
+
+def read_header(data):
+    """``(format, (width, height))`` from the image header alone, or ``(None, None)``."""
+    try:
+        header = Image.open(BytesIO(data))  # reads the header only
+    except Exception:
+        return None, None
+    return header.format, header.size
+
+def reduction_factor(data, target_size):
+    """Largest JPEG DCT scale (1/2, 1/4, 1/8) that keeps the long side >= target_size."""
+    image_format, size = read_header(data)
+    if image_format != 'JPEG':
+        return 1
+    long_side = max(size)
+    for factor in REDUCED_DECODE_FLAGS:
+        if long_side / factor >= target_size:
+            return factor
+    return 1
+
+def decode_image(data, target_size=None):
+    """Decode raw upload bytes straight into a BGR ndarray.
+
+    With ``target_size``, large JPEGs are decoded directly at a reduced scale
+    (libjpeg skips the discarded DCT coefficients), so a 4K photo never exists
+    in memory at full size. Returns ``(image, scale)`` where ``scale`` maps
+    decoded pixel coordinates back to the original (``(None, None)`` if undecodable).
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    factor = reduction_factor(data, target_size) if target_size else 1
+    image = cv2.imdecode(buffer, REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    if image is None:
+        return None, None
+    return image, float(factor)
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def stored_original(filename):
+    """Path of the kept original: the file itself or its recompressed copy, None if neither exists."""
+    for suffix in ('',) + tuple(ext for ext, _ in RECOMPRESS_FORMATS.values()):
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename + suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+def save_original(path, data):
+    with STAGE_SECONDS.time(stage='save'):
+        # Write-then-rename so a reader never sees a half-written original
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        write_file(tmp_path, data)
+        os.replace(tmp_path, path)
+
+def save_original_in_background(filename, data):
+    """Queue the original's write; GETs for it (or its annotated copy) wait for it meanwhile."""
+    with pending_originals_lock:
+        if filename in pending_originals:
+            return
+        future = pending_originals[filename] = io_executor.submit(
+            save_original, os.path.join(app.config['UPLOAD_FOLDER'], filename), data)
+
+    def forget(_):
+        with pending_originals_lock:
+            pending_originals.pop(filename, None)
+    future.add_done_callback(forget)
+
+def wait_for_original(filename):
+    """Block until a queued background write of ``filename`` (if any) has finished."""
+    with pending_originals_lock:
+        future = pending_originals.get(filename)
+    if future is not None:
+        try:
+            future.result(timeout=ORIGINAL_WRITE_WAIT_S)
+        except Exception:
+            pass
+
+def use_sliced_inference(data, requested=None):
+    """Whether this upload should go through tiled inference (config, ?sliced= and image size)."""
+    if requested is not None:
+        enabled = requested.lower() in ('1', 'true', 'yes')
+    else:
+        enabled = SLICED_INFERENCE == 'auto'
+    if not enabled:
+        return False
+    _, size = read_header(data)
+    return size is not None and max(size) >= SLICE_MIN_SIDE
+
+def tile_starts(length, tile, overlap):
+    """Start offsets of overlapping tiles covering ``length``; the last tile is flush with the edge."""
+    if length <= tile:
+        return np.zeros(1, dtype=int)
+    stride = max(1, int(tile * (1 - overlap)))
+    count = int(np.ceil((length - tile) / stride)) + 1
+    return np.minimum(np.arange(count) * stride, length - tile)
+
+def sliced_predict(image):
+    """Detect faces on overlapping full-resolution tiles plus one full-frame pass.
+
+    All crops go to the model as a single batch; tile boxes are shifted back to
+    image coordinates and everything is merged with one NMS pass.
+    """
+    h, w = image.shape[:2]
+    ys, xs = np.meshgrid(tile_starts(h, SLICE_SIZE, SLICE_OVERLAP),
+                         tile_starts(w, SLICE_SIZE, SLICE_OVERLAP), indexing='ij')
+    origins = np.column_stack([xs.ravel(), ys.ravel()])
+    crops = [image[y:y + SLICE_SIZE, x:x + SLICE_SIZE] for x, y in origins]
+
+    # The full-frame pass catches faces larger than a tile
+    detections = batcher.predict_many(crops + [image])
+    offsets = np.vstack([np.tile(origins, 2), np.zeros((1, 4), dtype=int)])
+
+    boxes = np.concatenate([d[0] + offset for d, offset in zip(detections, offsets)]).astype(np.float32)
+    confidences = np.concatenate([d[1] for d in detections]).astype(np.float32)
+    if len(boxes) == 0:
+        return boxes.reshape(0, 4), confidences
+
+    xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+    keep = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), confidences.tolist(), 0.0, SLICE_NMS_IOU), dtype=int).reshape(-1)
+    keep = keep[np.argsort(-confidences[keep])]
+    return boxes[keep], confidences[keep]
+
+def draw_faces(image, faces, scale=1.0):
+    """Draw face boxes (original-image coordinates) on ``image``, which is ``scale``x smaller.
+
+    All boxes go to OpenCV as one polyline batch instead of one rectangle call per face.
+    """
+    if not faces:
+        return image
+    boxes = np.array([face['bbox'] for face in faces], dtype=np.float32)
+    boxes = np.rint(boxes / scale).astype(np.int32)
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    cv2.polylines(image, list(corners), True, (0, 0, 255), 2)
+    return image
+
+def annotated_image_path(annotated_filename, faces=None):
+    """Path of the annotated image, rendering it from the original + stored bboxes on first use."""
+    legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], annotated_filename)
+    if os.path.exists(legacy_path):
+        return legacy_path
+
+    cached_path = annotated_cache.lookup(annotated_filename)
+    if cached_path is not None:
+        return cached_path
+
+    with annotated_cache.rendering(annotated_filename):
+        # Another request may have rendered it while this one waited
+        cached_path = annotated_cache.lookup(annotated_filename)
+        if cached_path is not None:
+            return cached_path
+        return render_annotated(annotated_filename, faces)
+
+def render_annotated(annotated_filename, faces=None):
+    filename = annotated_filename[len('annotated_'):]
+    if faces is None:
+        row = upload_index.get(filename)
+        if row is None or row['faces'] is None:
+            return None
+        faces = json.loads(row['faces'])
+
+    wait_for_original(filename)
+    original_path = stored_original(filename)
+    if original_path is None:
+        return None
+    with STAGE_SECONDS.time(stage='imread'):
+        img = cv2.imread(original_path)
+    if img is None:
+        return None
+    with STAGE_SECONDS.time(stage='draw'):
+        annotated = draw_faces(img, faces)
+    with STAGE_SECONDS.time(stage='imwrite'):
+        return annotated_cache.store(annotated_filename, annotated)
 
 def image_to_base64(image):
     _, buffer = cv2.imencode('.jpg', image)
     return "data:image/jpeg;base64," + base64.b64encode(buffer).decode()
 
+class CursorMismatch(ValueError):
+    """A valid cursor replayed with a different sort, order or from/to range."""
+
+def encode_cursor(row, listing):
+    """Opaque cursor: the last row's position plus the listing (sort, order, from, to) it belongs to."""
+    value = {'after': [row['sort_key'], row['filename']], **listing}
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def decode_cursor(cursor, listing):
+    """``(sort_value, filename)`` from a cursor made by ``encode_cursor``.
+
+    Raises ValueError if it is malformed and CursorMismatch if it was issued for another listing.
+    """
+    value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    after = value.get('after') if isinstance(value, dict) else None
+    if (not isinstance(after, list) or len(after) != 2 or not isinstance(after[1], str)
+            or not isinstance(after[0], (str, int, float, type(None)))):
+        raise ValueError('Invalid cursor')
+    if any(value.get(name) != listing[name] for name in listing):
+        raise CursorMismatch('Cursor was issued for a different sort, order or from/to range')
+    return tuple(after)
+
+def index_row_to_file(row):
+    return {
+        'filename': row['filename'],
+        'url': f"/uploads/{row['filename']}",
+        'annotated_url': f"/uploads/{row['annotated_filename']}",
+        'size': row['size'],
+        'uploaded_at': row['uploaded_at'],
+        'last_seen_at': row['last_seen_at'],
+        'upload_count': row['upload_count'],
+        'face_count': row['face_count'],
+        'faces': json.loads(row['faces']) if row['faces'] else None
+    }
+
+def iter_disk_uploads(folder):
+    """Lazily walk the uploads folder; one os.scandir entry in memory at a time."""
+    with os.scandir(folder) as entries:
+        for item in entries:
+            if item.is_file() and allowed_file(item.name):
+                stat = item.stat()
+                yield {
+                    'filename': item.name,
+                    'url': f'/uploads/{item.name}',
+                    'size': stat.st_size,
+                    'uploaded_at': datetime.fromtimestamp(stat.st_ctime).isoformat()
+                }
+
+def file_to_base64(path):
+    mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        return f"data:{mime_type};base64," + base64.b64encode(f.read()).decode()
+
+def get_response_mode():
+    """Pick the response mode from ?response=..., falling back to ``Prefer: return=minimal``."""
+    mode = request.args.get('response')
+    if mode:
+        return mode
+    if 'return=minimal' in request.headers.get('Prefer', ''):
+        return 'urls'
+    return 'full'
+
+def build_result(entry, mode='full', annotated_base64=None, cached=False):
+    faces = entry['faces']
+    result = {
+        'success': True,
+        'message': f'Detected {len(faces)} faces',
+        'face_count': len(faces),
+        'faces': faces,
+        'content_hash': entry['content_hash'],
+        'sliced': entry.get('sliced', False),
+        'cached': cached,
+        'response_mode': mode,
+        'processed_at': datetime.now().isoformat(),
+        'yolo_used': True,
+        'mock': False
+    }
+    if mode == 'bbox':
+        return result
+
+    filename = entry['filename']
+    annotated_filename = entry['annotated_filename']
+    result['original_image'] = {
+        'filename': filename,
+        'url': f'/uploads/{filename}' if entry.get('original_saved', True) else None
+    }
+    result['annotated_image'] = {
+        'filename': annotated_filename,
+        'url': f'/uploads/{annotated_filename}' if entry.get('original_saved', True) else None
+    }
+    if mode == 'full':
+        result['annotated_image']['base64'] = annotated_base64
+    return result
+
+def cached_result(digest, mode='full', sliced=False):
+    """Return ``(entry, response)`` for a previously processed upload, or None."""
+    entry = result_cache.get(digest)
+    if entry is None or entry.get('sliced', False) != sliced:
+        return None
+    if mode != 'full':
+        return entry, build_result(entry, mode, cached=True)
+
+    annotated_path = annotated_image_path(entry['annotated_filename'], entry['faces'])
+    if annotated_path is None:
+        return None
+    return entry, build_result(entry, mode, file_to_base64(annotated_path), cached=True)
+
+def get_uploaded_image():
+    """Validate the 'image' form file; returns ``(file, None)`` or ``(None, (error, status))``."""
+    if 'image' not in request.files:
+        return None, ({'error': 'No image file provided'}, 400)
+
+    file = request.files['image']
+    if file.filename == '':
+        return None, ({'error': 'No file selected'}, 400)
+
+    if not allowed_file(file.filename):
+        return None, ({'error': 'Invalid file type'}, 400)
+    return file, None
+
+def detect_faces(img, scale=1.0, sliced=False):
+    """Run YOLOv8 face detection (batched with other in-flight requests); boxes in original-image pixels."""
+    if sliced:
+        boxes, confidences = sliced_predict(img)
+    else:
+        boxes, confidences = batcher.predict(img)
+    boxes = boxes * scale
+
+    # Whole-array casts, then one pass to build the JSON-ready list
+    bboxes = boxes.astype(int).tolist()
+    return [{'bbox': bbox, 'confidence': conf}
+            for bbox, conf in zip(bboxes, confidences.astype(float).tolist())]
+
+def process_upload(data, original_filename, mode='full', sliced=None):
+    """Detect faces in one uploaded image; returns ``(result, http_status)``.
+
+    Needs no request context, so the sync route and the background job workers share it.
+    """
+    with STAGE_SECONDS.time(stage='hash'):
+        digest = content_hash(data)
+    sliced = use_sliced_inference(data, sliced)
+
+    # Repeated upload: answer from the cache without touching the model
+    with STAGE_SECONDS.time(stage='cache_lookup'):
+        cached = cached_result(digest, mode, sliced)
+    if cached is not None:
+        entry, result = cached
+        upload_index.touch(entry['filename'])
+        return result, 200
+
+    # Decode once in memory (near model resolution for big JPEGs unless tiling,
+    # which needs full resolution); the same array feeds the model and the annotator
+    with STAGE_SECONDS.time(stage='decode'):
+        img, scale = decode_image(data, INFER_SIZE if REDUCED_DECODE and not sliced else None)
+    if img is None:
+        return {'error': 'Could not decode image'}, 400
+
+    # Persist the original in the background
+    filename = generate_filename(original_filename, digest)
+    if SAVE_ORIGINALS and stored_original(filename) is None:
+        save_original_in_background(filename, data)
+
+    # (the 'inference' stage includes time queued for a batch; the model call itself
+    # is face_server_inference_duration_seconds)
+    with STAGE_SECONDS.time(stage='inference'):
+        faces = detect_faces(img, scale, sliced)
+
+    # The annotated file is rendered lazily on first GET; only draw here when sent inline
+    annotated_filename = f"annotated_{filename}"
+    annotated_base64 = None
+    if mode == 'full':
+        with STAGE_SECONDS.time(stage='draw'):
+            annotated = draw_faces(img, faces, scale)
+        with STAGE_SECONDS.time(stage='base64'):
+            annotated_base64 = image_to_base64(annotated)
+
+    entry = {
+        'content_hash': digest,
+        'filename': filename,
+        'annotated_filename': annotated_filename,
+        'original_saved': SAVE_ORIGINALS,
+        'size': len(data),
+        'sliced': sliced,
+        'faces': faces
+    }
+    with STAGE_SECONDS.time(stage='index'):
+        result_cache.put(digest, entry)
+        upload_index.record(entry)
+
+    return build_result(entry, mode, annotated_base64), 200
+
+def read_bulk_images():
+    """Collect ``(filename, data)`` pairs from the multipart files of a bulk upload.
+
+    Zip archives are expanded in place. Members with an unsupported type or over
+    MAX_FILE_SIZE are returned with ``data=None`` so they still get a result line.
+    BULK_MAX_FILES and BULK_MAX_UNCOMPRESSED are enforced before each read, so a
+    zip bomb is rejected without being expanded. Returns ``(images, None)`` or
+    ``(None, (error, status))``.
+    """
+    images = []
+    total_bytes = 0
+
+    def add(filename, size, read):
+        nonlocal total_bytes
+        if len(images) >= BULK_MAX_FILES:
+            return f'Too many images (max {BULK_MAX_FILES})', 400
+        if read is not None:
+            if total_bytes + size > BULK_MAX_UNCOMPRESSED:
+                return f'Images exceed {BULK_MAX_UNCOMPRESSED // (1024 * 1024)}MB uncompressed', 413
+            total_bytes += size
+        images.append((filename, read() if read is not None else None))
+        return None
+
+    for file in request.files.getlist('images') + request.files.getlist('image'):
+        if file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or os.path.basename(info.filename).startswith('.'):
+                            continue
+                        # file_size is the declared size; reads never go past it
+                        ok = allowed_file(info.filename) and info.file_size <= MAX_FILE_SIZE
+                        error = add(info.filename, info.file_size,
+                                    functools.partial(archive.read, info) if ok else None)
+                        if error:
+                            return None, error
+            except zipfile.BadZipFile:
+                error = add(file.filename, 0, None)
+                if error:
+                    return None, error
+        elif file.filename:
+            data = file.read() if allowed_file(file.filename) else None
+            if data is not None and len(data) > MAX_FILE_SIZE:
+                data = None
+            error = add(file.filename, len(data or b''), (lambda: data) if data is not None else None)
+            if error:
+                return None, error
+    return images, None
+
+def stream_bulk_results(images, mode, sliced):
+    """Yield one NDJSON line per image as it finishes, then a summary line.
+
+    Images are processed concurrently so the micro-batcher can group them into
+    real model batches.
+    """
+    started = time.perf_counter()
+    failed = 0
+    futures = {}
+    for index, (name, data) in enumerate(images):
+        if data is None:
+            failed += 1
+            yield json.dumps({'index': index, 'filename': name, 'status': 400,
+                              'error': 'Invalid file type or file too large'}) + '\n'
+            continue
+        futures[bulk_executor.submit(process_upload, data, name, mode, sliced)] = (index, name)
+
+    for future in as_completed(futures):
+        index, name = futures[future]
+        try:
+            result, status = future.result()
+        except Exception as e:
+            result, status = {'error': 'Failed to process image', 'details': str(e)}, 500
+        failed += status >= 400
+        yield json.dumps({'index': index, 'filename': name, 'status': status, **result}) + '\n'
+
+    yield json.dumps({
+        'done': True,
+        'total': len(images),
+        'processed': len(images) - failed,
+        'failed': failed,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }) + '\n'
+
+# ---------------- ASYNC JOBS ----------------
+class JobQueue:
+    """Bounded background queue for /upload-and-process/async.
+
+    ``submit`` returns None when the queue is full so the route can answer 429.
+    Finished jobs are kept for ``ttl`` seconds for polling, and optionally POSTed
+    to a callback URL.
+    """
+
+    def __init__(self, max_depth, workers, ttl):
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'upload-job-{i}', daemon=True).start()
+
+    def submit(self, data, original_filename, mode, sliced, callback_url):
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'filename': original_filename,
+            'callback_url': callback_url,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        # Registered before it is queued, so a worker never picks up a job it can't update
+        with self._lock:
+            self._prune()
+            self._jobs[job['id']] = job
+            snapshot = dict(job)
+        try:
+            self._queue.put_nowait((job['id'], data, original_filename, mode, sliced))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job['id']]
+                self.stats['rejected'] += 1
+            return None
+
+        with self._lock:
+            self.stats['submitted'] += 1
+        return snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                return dict(job)
+        return None
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] and datetime.fromisoformat(job['finished_at']).timestamp() < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job_id, data, original_filename, mode, sliced = self._queue.get()
+            self._update(job_id, status='running', started_at=datetime.now().isoformat())
+            try:
+                result, status = process_upload(data, original_filename, mode, sliced)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                result, status = {'error': 'Failed to process image', 'details': str(e)}, 500
+
+            failed = status >= 400
+            job = self._update(job_id,
+                               status='failed' if failed else 'done',
+                               finished_at=datetime.now().isoformat(),
+                               result=None if failed else result,
+                               error=result if failed else None)
+            with self._lock:
+                self.stats['failed' if failed else 'completed'] += 1
+
+            if job and job['callback_url']:
+                self._notify(job)
+
+    def _notify(self, job):
+        try:
+            response = requests.post(job['callback_url'], json=job, timeout=JOB_CALLBACK_TIMEOUT_S)
+            self._update(job['id'], callback_status=response.status_code)
+        except requests.RequestException as e:
+            print(f"⚠️  Job {job['id']} callback failed: {e}")
+            self._update(job['id'], callback_status=None, callback_error=str(e))
+
+    def info(self):
+        with self._lock:
+            return {**self.stats, 'queue_depth': self._queue.qsize(), 'max_depth': self._queue.maxsize,
+                    'tracked_jobs': len(self._jobs)}
+
+job_queue = JobQueue(JOB_QUEUE_SIZE, JOB_WORKERS, JOB_TTL_S)
+
+# ---------------- STARTUP ----------------
+# At import, so any way of loading the app (python flask_app.py, a WSGI server,
+# the in-process benchmark) lists uploads that predate the index
+if upload_index.is_empty():
+    print(f"🗂️  Indexed {upload_index.backfill(UPLOAD_FOLDER)} existing uploads")
+
+def warm_up_model():
+    """Background start-up phase: warm the model, then flip readiness.
+
+    Liveness (/health/live) is up from the first request; /health/ready answers 503
+    until this finishes, so no real upload pays for lazy model initialisation.
+    """
+    started = time.perf_counter()
+    try:
+        if inference_pool is not None:
+            # Workers load and warm themselves; wait for all of them (or for them to die)
+            while not inference_pool.ready():
+                if not inference_pool.info()['workers_alive']:
+                    raise RuntimeError('All inference workers have exited')
+                time.sleep(0.1)
+            worker_timings = inference_pool.worker_timings.values()
+            for name in ('model_load_s', 'warmup_s'):
+                boot['timings'][name] = max((t.get(name, 0.0) for t in worker_timings), default=0.0)
+        elif WARMUP:
+            # Through the batcher, so warm-up never races a real batch on the same model
+            warm_up(batcher.predict_many, WARMUP_SIZES, BATCH_MAX_SIZE)
+    except Exception as e:
+        boot['error'] = str(e)
+        print(f"❌ Model warm-up failed: {e}")
+        return
+
+    key = 'workers_ready_s' if inference_pool is not None else 'warmup_s'
+    boot['timings'][key] = round(time.perf_counter() - started, 3)
+    boot['timings']['total_s'] = round(time.perf_counter() - BOOT_STARTED, 3)
+    boot['ready'] = True
+    print("⏱️  Boot: " + ", ".join(f"{name[:-2].replace('_', ' ')} {value}s" for name, value in boot['timings'].items()))
+
+threading.Thread(target=warm_up_model, name='model-warmup', daemon=True).start()
+
+# ---------------- PROFILING ----------------
+profile_store = (ProfileStore(PROFILE_FOLDER, PROFILE_MAX_PROFILES)
+                 if PROFILE_REQUESTS or PROFILE_SAMPLE_RATE > 0 else None)
+
+def profiled(view):
+    """Profile a view when asked for (X-Profile header) or sampled.
+
+    With profiling off the view is returned as is, so it costs nothing.
+    """
+    if profile_store is None:
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        wanted = ((PROFILE_REQUESTS and request.headers.get(PROFILE_HEADER) == '1')
+                  or random.random() < PROFILE_SAMPLE_RATE)
+        if not wanted:
+            return view(*args, **kwargs)
+
+        rv, profile = profile_call(lambda: view(*args, **kwargs), PROFILE_INTERVAL_MS)
+        profile_id = profile_store.new_id(view.__name__)
+        io_executor.submit(profile_store.save, profile_id, profile)
+        response = app.make_response(rv)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    return wrapper
+
+# ---------------- RETENTION ----------------
+class RetentionManager:
+    """Background passes that keep UPLOAD_FOLDER within its quotas (tiers described under RETENTION_* config).
+
+    Files are grouped by the original they belong to (``x.png``, ``annotated_x.png``,
+    ``x.png.webp``); an upload's age is its index ``last_seen_at``, or the newest file
+    mtime when it is not indexed. With ``dry_run`` each tier reports what it alone would free.
+    """
+
+    def __init__(self, folder, interval_s, recompress_days=0, max_age_days=0, max_bytes=0, dry_run=False):
+        self.folder = folder
+        self.interval_s = interval_s
+        self.recompress_days = recompress_days
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.dry_run = dry_run
+        self.runs = 0
+        self.bytes_reclaimed = 0
+        self.last_run = None
+        self._hashes = {}  # (dev, inode, size, mtime) -> sha256, so unchanged files are hashed once
+        self._lock = threading.Lock()  # one pass at a time
+
+    def start(self):
+        threading.Thread(target=self._loop, name='upload-retention', daemon=True).start()
+
+    def _loop(self):
+        # First pass once the model is warm: backfilled rows may need re-detection
+        while not boot['ready'] and 'error' not in boot:
+            time.sleep(1)
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                print(f"❌ Retention pass failed: {e}")
+            time.sleep(self.interval_s)
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _scan(self):
+        """``{original filename: [(file name, stat), ...]}`` for everything in the folder."""
+        suffixes = tuple(ext for ext, _ in RECOMPRESS_FORMATS.values())
+        groups = {}
+        with os.scandir(self.folder) as entries:
+            for item in entries:
+                if not item.is_file() or not allowed_file(item.name):
+                    continue
+                original = item.name[len('annotated_'):] if item.name.startswith('annotated_') else item.name
+                stem, ext = os.path.splitext(original)
+                if ext in suffixes and allowed_file(stem):
+                    original = stem
+                groups.setdefault(original, []).append((item.name, item.stat()))
+        return groups
+
+    def _last_seen(self, original, files, rows):
+        row = rows.get(original)
+        if row is not None and row['last_seen_at']:
+            return datetime.fromisoformat(row['last_seen_at']).timestamp()
+        return max(stat.st_mtime for _, stat in files)
+
+    def _remove(self, name):
+        """Delete one file; returns the bytes freed (none while other hard links remain)."""
+        try:
+            stat = os.stat(self._path(name))
+            if not self.dry_run:
+                os.remove(self._path(name))
+        except OSError:
+            return 0
+        return stat.st_size if stat.st_nlink == 1 else 0
+
+    def _link(self, source, target):
+        """Atomically make ``target`` a hard link to ``source``; False where links are unsupported."""
+        if self.dry_run:
+            return True
+        tmp_path = self._path(target) + '.tmp'
+        try:
+            os.link(self._path(source), tmp_path)
+            os.replace(tmp_path, self._path(target))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _redetect(self, original):
+        """Index boxes for a row backfilled without them, so its annotated copy can be re-rendered."""
+        if self.dry_run:
+            return True
+        path = stored_original(original)
+        if path is None or not boot['ready']:
+            return False
+        with open(path, 'rb') as f:
+            data = f.read()
+        img, scale = decode_image(data, INFER_SIZE if REDUCED_DECODE else None)
+        if img is None:
+            return False
+        # A recompressed copy no longer hashes like the upload did
+        digest = content_hash(data) if os.path.basename(path) == original else None
+        upload_index.set_faces(original, digest, detect_faces(img, scale))
+        return True
+
+    def drop_annotated(self, groups, rows):
+        """Tier 1: annotated_ copies in the upload folder, when the original and its boxes are kept."""
+        dropped = freed = 0
+        for original, files in groups.items():
+            copies = [name for name, _ in files if name.startswith('annotated_')]
+            row = rows.get(original)
+            if not copies or row is None or stored_original(original) is None:
+                continue
+            if row['faces'] is None and not self._redetect(original):
+                continue
+            for name in copies:
+                freed += self._remove(name)
+                dropped += 1
+        return dropped, freed
+
+    def recompress(self, groups, rows, cutoff):
+        """Tier 2: originals last seen before ``cutoff`` become ``<name><ext>`` in RETENTION_FORMAT."""
+        ext, quality_flag = RECOMPRESS_FORMATS[RETENTION_FORMAT]
+        converted = {}  # inode -> recompressed name, so hard-linked duplicates are encoded once
+        count = freed = 0
+        for original, files in groups.items():
+            stat = dict(files).get(original)
+            already = any(name not in (original, f'annotated_{original}') for name, _ in files)
+            if stat is None or already or self._last_seen(original, files, rows) > cutoff:
+                continue
+
+            target = original + ext
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in converted and self._link(converted[inode], target):
+                added = 0
+            else:
+                img = cv2.imread(self._path(original))
+                if img is None:
+                    continue
+                ok, buffer = cv2.imencode(ext, img, [quality_flag, RETENTION_QUALITY])
+                # Not worth a lossy copy unless it saves at least 10%
+                if not ok or buffer.nbytes > stat.st_size * 0.9:
+                    continue
+                if not self.dry_run:
+                    write_file(self._path(target) + '.tmp', buffer.tobytes())
+                    os.replace(self._path(target) + '.tmp', self._path(target))
+                added = buffer.nbytes
+                converted[inode] = target
+            freed += self._remove(original) - added
+            count += 1
+        return count, freed
+
+    def _content_hash(self, name, stat, rows):
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        digest = self._hashes.get(key)
+        if digest is None:
+            row = rows.get(name)
+            if row is not None and row['content_hash']:
+                digest = row['content_hash']  # the upload's own bytes, hashed when it came in
+            else:
+                with open(self._path(name), 'rb') as f:
+                    digest = content_hash(f.read())
+            self._hashes[key] = digest
+        return key, digest
+
+    def deduplicate(self, groups, rows):
+        """Tier 3: byte-identical originals (legacy re-uploads) become hard links to one copy.
+
+        Only same-size files on distinct inodes are compared, each by a hash that is
+        computed once per file version (or taken from the index).
+        """
+        by_size = {}
+        for files in groups.values():
+            for name, stat in files:
+                if not name.startswith('annotated_'):
+                    by_size.setdefault(stat.st_size, {}).setdefault((stat.st_dev, stat.st_ino), []).append((name, stat))
+
+        count = freed = 0
+        seen = set()
+        for inodes in by_size.values():
+            if len(inodes) < 2:
+                continue
+            kept = {}
+            for names in inodes.values():
+                name, stat = names[0]
+                key, digest = self._content_hash(name, stat, rows)
+                seen.add(key)
+                if digest not in kept:
+                    kept[digest] = name
+                    continue
+                # Re-link every name of this inode to the kept copy
+                for name, stat in names:
+                    size = stat.st_size if os.stat(self._path(name)).st_nlink == 1 else 0
+                    if self._link(kept[digest], name):
+                        freed += size
+                        count += 1
+        self._hashes = {key: digest for key, digest in self._hashes.items() if key in seen}
+        return count, freed
+
+    def _delete_upload(self, original, files, rows):
+        freed = sum(self._remove(name) for name, _ in files)
+        if not self.dry_run:
+            row = rows.get(original)
+            if row is not None:
+                upload_index.delete(original)
+                if row['content_hash']:
+                    result_cache.discard(row['content_hash'])
+            annotated_cache.discard(f'annotated_{original}')
+        return freed
+
+    def expire(self, groups, rows, cutoff):
+        """Tier 4: uploads last seen before ``cutoff``, with their index row and cached results."""
+        count = freed = 0
+        for original, files in groups.items():
+            if self._last_seen(original, files, rows) < cutoff:
+                freed += self._delete_upload(original, files, rows)
+                count += 1
+        return count, freed
+
+    def evict(self, groups, rows, max_bytes):
+        """Tier 5: least recently seen uploads until the folder fits in ``max_bytes``."""
+        sizes = {(stat.st_dev, stat.st_ino): stat.st_size for files in groups.values() for _, stat in files}
+        total = sum(sizes.values())
+        count = freed = 0
+        for original, files in sorted(groups.items(), key=lambda item: self._last_seen(*item, rows)):
+            if total <= max_bytes:
+                break
+            bytes_freed = self._delete_upload(original, files, rows)
+            total -= bytes_freed
+            freed += bytes_freed
+            count += 1
+        return count, freed
+
+    def run(self):
+        """One retention pass; returns its report (None if a pass is already running)."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.perf_counter()
+            now = time.time()
+            rows = {row['filename']: row for row in upload_index.iter_rows()}
+            report = {'started_at': datetime.now().isoformat(), 'dry_run': self.dry_run}
+            reclaimed = {}
+
+            report['annotated_dropped'], reclaimed['annotated'] = self.drop_annotated(self._scan(), rows)
+            if self.recompress_days > 0:
+                report['recompressed'], reclaimed['recompress'] = self.recompress(
+                    self._scan(), rows, now - self.recompress_days * 86400)
+            report['deduplicated'], reclaimed['dedupe'] = self.deduplicate(self._scan(), rows)
+            if self.max_age_days > 0:
+                report['expired'], reclaimed['expire'] = self.expire(self._scan(), rows, now - self.max_age_days * 86400)
+            if self.max_bytes > 0:
+                report['evicted'], reclaimed['evict'] = self.evict(self._scan(), rows, self.max_bytes)
+
+            elapsed = time.perf_counter() - started
+            report['duration_s'] = round(elapsed, 3)
+            report['bytes_reclaimed'] = sum(reclaimed.values())
+            report['bytes_reclaimed_by_tier'] = reclaimed
+            RETENTION_RUN_SECONDS.observe(elapsed)
+            if not self.dry_run:
+                for tier, freed in reclaimed.items():
+                    if freed > 0:
+                        RETENTION_RECLAIMED.inc(freed, tier=tier)
+                self.bytes_reclaimed += report['bytes_reclaimed']
+            self.runs += 1
+            self.last_run = report
+
+            counts = ', '.join(f"{key.replace('_', ' ')} {value}" for key, value in report.items()
+                               if key in ('annotated_dropped', 'recompressed', 'deduplicated', 'expired', 'evicted'))
+            print(f"🧹 Retention{' (dry run)' if self.dry_run else ''}: reclaimed "
+                  f"{report['bytes_reclaimed'] / (1024 * 1024):.1f}MB in {elapsed:.2f}s ({counts})")
+            return report
+        finally:
+            self._lock.release()
+
+    def info(self):
+        return {
+            'interval_min': self.interval_s / 60,
+            'dry_run': self.dry_run,
+            'runs': self.runs,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'last_run': self.last_run
+        }
+
+retention = RetentionManager(UPLOAD_FOLDER, RETENTION_INTERVAL_MIN * 60, RETENTION_RECOMPRESS_DAYS,
+                             RETENTION_MAX_AGE_DAYS, RETENTION_MAX_BYTES, RETENTION_DRY_RUN)
+if RETENTION_INTERVAL_MIN > 0:
+    # At import like the index backfill above, so the first pass sees every upload's row
+    print(f"🧹 Upload retention every {RETENTION_INTERVAL_MIN:g} min{' (dry run)' if RETENTION_DRY_RUN else ''}")
+    retention.start()
+
 # ---------------- ROUTES ----------------
+@app.errorhandler(413)
+def request_too_large(e):
+    limit_mb = (request.max_content_length or MAX_FILE_SIZE) // (1024 * 1024)
+    return jsonify({'error': 'File too large', 'details': f'Maximum request size is {limit_mb}MB'}), 413
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'flask-yolo-server',
         'yolo_available': True,
+        'live': True,
+        'ready': boot['ready'],
+        'boot': boot,
+        'inference_backend': INFERENCE_BACKEND,
+        'model_precision': MODEL_PRECISION,
+        'model_path': BACKEND_MODEL_PATH,
+        'batching': {'max_batch_size': batcher.max_batch_size, 'max_wait_ms': BATCH_MAX_WAIT_MS},
+        'inference_pool': inference_pool.info() if inference_pool is not None else None,
+        'result_cache': result_cache.info(),
+        'annotated_cache': annotated_cache.info(),
+        'jobs': job_queue.info(),
+        'profiling': profile_store.info() if profile_store is not None else None,
+        'retention': retention.info() if RETENTION_INTERVAL_MIN > 0 else None,
         'upload_folder': UPLOAD_FOLDER,
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """200 once the model is loaded and warmed; 503 while starting (or if warm-up failed)."""
+    if not boot['ready']:
+        return jsonify({'status': 'starting' if 'error' not in boot else 'failed', **boot}), 503
+    return jsonify({'status': 'ready', **boot})
+
 @app.route('/upload-and-process', methods=['POST'])
+@profiled
 def upload_and_process():
     try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
+        file, error = get_uploaded_image()
+        if error:
+            return jsonify(error[0]), error[1]
 
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        mode = get_response_mode()
+        if mode not in RESPONSE_MODES:
+            return jsonify({'error': f'Invalid response mode: {mode}'}), 400
 
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type'}), 400
+        result, status = process_upload(file.read(), file.filename, mode, request.args.get('sliced'))
+        return jsonify(result), status
 
-        # Save file
-        filename = generate_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    except HTTPException:
+        raise  # e.g. 413 from parsing an oversized body; answered by the error handlers
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to process image', 'details': str(e)}), 500
 
-        # Run YOLOv8 face detection
-        results = model(filepath)
-        boxes = results[0].boxes.xyxy.cpu().numpy()
-        confidences = results[0].boxes.conf.cpu().numpy()
+@app.route('/upload-and-process/async', methods=['POST'])
+def upload_and_process_async():
+    try:
+        file, error = get_uploaded_image()
+        if error:
+            return jsonify(error[0]), error[1]
 
-        faces = []
-        img = cv2.imread(filepath)
+        # Job results are kept in memory, so skip the inline image unless asked for
+        mode = request.args.get('response', 'urls')
+        if mode not in RESPONSE_MODES:
+            return jsonify({'error': f'Invalid response mode: {mode}'}), 400
 
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = box.astype(int)
-            conf = float(confidences[i])
+        callback_url = request.form.get('callback_url') or request.args.get('callback_url')
+        if callback_url and not callback_url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'callback_url must be an http(s) URL'}), 400
 
-            faces.append({
-                'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                'confidence': conf
-            })
+        job = job_queue.submit(file.read(), file.filename, mode, request.args.get('sliced'), callback_url)
+        if job is None:
+            response = jsonify({'error': 'Too many jobs queued, retry later', 'queue_depth': job_queue.depth()})
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER_S)
+            return response, 429
 
-            # Draw box
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/jobs/{job['id']}",
+            'queue_depth': job_queue.depth()
+        }), 202
 
-        # Save annotated file
-        annotated_filename = f"annotated_{filename}"
-        annotated_path = os.path.join(app.config['UPLOAD_FOLDER'], annotated_filename)
-        cv2.imwrite(annotated_path, img)
+    except HTTPException:
+        raise  # e.g. 413 from parsing an oversized body; answered by the error handlers
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to queue image', 'details': str(e)}), 500
 
-        # Convert annotated image to base64
-        annotated_base64 = image_to_base64(img)
+@app.route('/upload-and-process/batch', methods=['POST'])
+def upload_and_process_batch():
+    """Many images (repeated 'images' fields and/or zip archives) in one request.
 
-        return jsonify({
-            'success': True,
-            'message': f'Detected {len(faces)} faces',
-            'face_count': len(faces),
-            'faces': faces,
-            'original_image': {
-                'filename': filename,
-                'url': f'/uploads/{filename}'
-            },
-            'annotated_image': {
-                'filename': annotated_filename,
-                'url': f'/uploads/{annotated_filename}',
-                'base64': annotated_base64
-            },
-            'processed_at': datetime.now().isoformat(),
-            'yolo_used': True,
-            'mock': False
-        })
+    Results stream back as NDJSON in completion order; match them up by 'index'.
+    """
+    try:
+        mode = request.args.get('response', 'urls')
+        if mode not in RESPONSE_MODES:
+            return jsonify({'error': f'Invalid response mode: {mode}'}), 400
 
+        images, error = read_bulk_images()
+        if error:
+            message, status = error
+            return jsonify({'error': message}), status
+        if not images:
+            return jsonify({'error': 'No image files provided'}), 400
+
+        lines = stream_bulk_results(images, mode, request.args.get('sliced'))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    except HTTPException:
+        raise  # e.g. 413 from parsing an oversized body; answered by the error handlers
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({'error': 'Failed to process image', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to process images', 'details': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job)
 
 @app.route('/uploads/<filename>', methods=['GET'])
 def uploaded_file(filename):
+    if filename.startswith('annotated_') and secure_filename(filename) == filename:
+        annotated_path = annotated_image_path(filename)
+        if annotated_path is not None:
+            return send_from_directory(os.path.dirname(annotated_path) or '.', filename)
+    # Fresh uploads may still be in the background writer; old originals may only
+    # exist as their recompressed copy
+    wait_for_original(filename)
+    stored_path = stored_original(filename) if secure_filename(filename) == filename else None
+    if stored_path is not None:
+        return send_from_directory(app.config['UPLOAD_FOLDER'], os.path.basename(stored_path))
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/list-uploads', methods=['GET'])
 def list_uploads():
     try:
-        files = []
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if allowed_file(filename):
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                stat = os.stat(filepath)
-                files.append({
-                    'filename': filename,
-                    'url': f'/uploads/{filename}',
-                    'size': stat.st_size,
-                    'uploaded_at': datetime.fromtimestamp(stat.st_ctime).isoformat()
-                })
+        sort = request.args.get('sort', 'uploaded_at')
+        order = request.args.get('order', 'desc')
+        since = request.args.get('from')
+        until = request.args.get('to')
+        if sort not in UploadIndex.SORT_COLUMNS:
+            return jsonify({'error': f'Invalid sort field: {sort}'}), 400
+
+        # NDJSON streaming: one file per line, memory stays flat however large the archive
+        if request.args.get('format') == 'ndjson':
+            if request.args.get('source') == 'disk':
+                files = iter_disk_uploads(UPLOAD_FOLDER)
+            else:
+                files = (index_row_to_file(row) for row in upload_index.iter_rows(sort, order, since, until))
+            lines = (json.dumps(f) + '\n' for f in files)
+            return Response(lines, mimetype='application/x-ndjson')
 
-        return jsonify({'success': True, 'files': files, 'count': len(files)})
+        # ?total=1 adds the number of matching uploads (a COUNT over the range, so opt-in)
+        total = upload_index.count(since, until) if request.args.get('total') in ('1', 'true') else None
+
+        # Legacy offset pages (?page=N): each page costs more the deeper it is
+        if 'page' in request.args:
+            page = max(1, request.args.get('page', 1, type=int))
+            per_page = min(500, max(1, request.args.get('per_page', 50, type=int)))
+            files = [index_row_to_file(row) for row in upload_index.query(page, per_page, sort, order, since, until)]
+            return jsonify({
+                'success': True,
+                'files': files,
+                'count': len(files),
+                'total': total,
+                'page': page,
+                'per_page': per_page
+            })
+
+        # Default: cursor pagination, constant cost per page; pass back next_cursor for the next one
+        limit = min(500, max(1, request.args.get('limit', request.args.get('per_page', 50, type=int), type=int)))
+        cursor = request.args.get('cursor')
+        # Everything that decides row order and membership; a cursor is only valid for the same listing
+        listing = {'sort': sort, 'order': 'asc' if order == 'asc' else 'desc', 'from': since, 'to': until}
+        try:
+            after = decode_cursor(cursor, listing) if cursor else None
+        except CursorMismatch as e:
+            return jsonify({'error': 'Invalid cursor', 'details': str(e)}), 400
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        rows = upload_index.query_after(after, limit, sort, order, since, until)
+        return jsonify({
+            'success': True,
+            'files': [index_row_to_file(row) for row in rows],
+            'count': len(rows),
+            'total': total,
+            'next_cursor': encode_cursor(rows[-1], listing) if len(rows) == limit else None
+        })
 
     except Exception as e:
         return jsonify({'error': 'Failed to list files', 'details': str(e)}), 500
@@ -151,5 +1810,6 @@ def list_uploads():
 if __name__ == '__main__':
     print("🚀 Starting Real Flask YOLOv8 Face Server...")
     print(f"📁 Upload folder: {os.path.abspath(UPLOAD_FOLDER)}")
-    print(f"🤖 YOLO model: {MODEL_PATH}")
-    app.run(host='0.0.0.0', port=5001, debug=False)
+    print(f"🤖 YOLO model: {BACKEND_MODEL_PATH} ({INFERENCE_BACKEND}, {MODEL_PRECISION})")
+    print(f"🧵 Inference workers: {INFERENCE_WORKERS or 'in-process'}")
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5001)), debug=False)
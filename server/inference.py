@@ -0,0 +1,441 @@
+"""
+Face detector backends and the multi-process inference pool for the Flask face server.
+
+Every backend is a callable taking a list of BGR ndarrays and returning one
+``(boxes_xyxy, confidences)`` pair of float32 arrays per image, in original
+image coordinates:
+
+    ultralytics - the PyTorch ``.pt`` model through ``ultralytics.YOLO``
+    onnx        - an exported ``.onnx`` model on ONNX Runtime (CPU)
+    openvino    - an exported OpenVINO IR (``.xml``) model
+
+Export the ONNX / OpenVINO versions with ``python export_model.py``.
+
+Each pool worker process loads its own model instance, pinned to a slice of the
+host's CPUs. Batches are handed out through one shared task queue, so whichever
+worker is idle picks up the next batch. Image pixels travel through shared
+memory; only the small box/confidence arrays come back over the result queue.
+
+This module has no import-time side effects so it is safe to import from
+worker processes.
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'int8')  # int8 = quantized export, for the onnx / openvino backends
+
+# Match ultralytics' predict() defaults so every backend reports the same boxes
+DEFAULT_IMGSZ = 640
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+
+
+# ---------------- DETECTOR BACKENDS ----------------
+class UltralyticsDetector:
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+
+    def __call__(self, images):
+        results = self.model(images, verbose=False)
+        return [(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy()) for r in results]
+
+
+class ExportedDetector:
+    """Shared pre/post-processing for exported single-class YOLOv8 face models.
+
+    Input: letterboxed RGB float32 NCHW in [0, 1]. Output: ``(N, 4 + 1 [+ kpts], anchors)``
+    with cx, cy, w, h in letterbox pixels followed by the face score.
+    """
+
+    def __init__(self, imgsz=DEFAULT_IMGSZ, conf=DEFAULT_CONF, iou=DEFAULT_IOU, batch_size=None):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.batch_size = batch_size  # None = dynamic batch axis
+
+    def letterbox(self, image):
+        h, w = image.shape[:2]
+        gain = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        pad_x, pad_y = (self.imgsz - new_w) / 2, (self.imgsz - new_h) / 2
+        if (new_w, new_h) != (w, h):
+            image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, gain, (left, top)
+
+    def preprocess(self, images):
+        blobs, transforms = [], []
+        for image in images:
+            boxed, gain, pad = self.letterbox(image)
+            blobs.append(boxed)
+            transforms.append((gain, pad, image.shape[:2]))
+        # BGR HWC uint8 -> RGB CHW float32 in one vectorised pass over the batch
+        batch = np.stack(blobs)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0, transforms
+
+    def postprocess(self, output, transforms):
+        detections = []
+        for pred, (gain, (pad_x, pad_y), (h, w)) in zip(output, transforms):
+            pred = pred.T  # (anchors, channels)
+            scores = pred[:, 4]
+            keep = scores > self.conf
+            pred, scores = pred[keep], scores[keep]
+
+            boxes = np.empty((len(pred), 4), dtype=np.float32)
+            boxes[:, 0] = pred[:, 0] - pred[:, 2] / 2
+            boxes[:, 1] = pred[:, 1] - pred[:, 3] / 2
+            boxes[:, 2] = pred[:, 0] + pred[:, 2] / 2
+            boxes[:, 3] = pred[:, 1] + pred[:, 3] / 2
+
+            if len(boxes):
+                xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+                indices = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), self.conf, self.iou)
+                indices = np.asarray(indices, dtype=int).reshape(-1)
+                order = indices[np.argsort(-scores[indices])]
+                boxes, scores = boxes[order], scores[order]
+
+            # Undo the letterbox: back to original image pixels
+            boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+            boxes /= gain
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+            detections.append((boxes, scores.astype(np.float32)))
+        return detections
+
+    def forward(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, images):
+        if not images:
+            return []
+        step = self.batch_size or len(images)
+        detections = []
+        for start in range(0, len(images), step):
+            batch, transforms = self.preprocess(images[start:start + step])
+            detections.extend(self.postprocess(self.forward(batch), transforms))
+        return detections
+
+
+class OnnxDetector(ExportedDetector):
+    def __init__(self, model_path, threads=None, **kwargs):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        batch_dim, _, height, _ = model_input.shape
+        kwargs.setdefault('imgsz', height if isinstance(height, int) else DEFAULT_IMGSZ)
+        kwargs.setdefault('batch_size', batch_dim if isinstance(batch_dim, int) else None)
+        super().__init__(**kwargs)
+
+    def forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoDetector(ExportedDetector):
+    def __init__(self, model_path, threads=None, **kwargs):
+        from openvino.runtime import Core
+
+        core = Core()
+        config = {'INFERENCE_NUM_THREADS': threads} if threads else {}
+        model = core.read_model(model_path)
+        self.compiled = core.compile_model(model, 'CPU', config)
+        self.output = self.compiled.output(0)
+
+        input_shape = model.input(0).get_partial_shape()
+        if input_shape[2].is_static:
+            kwargs.setdefault('imgsz', input_shape[2].get_length())
+        if input_shape[0].is_static:
+            kwargs.setdefault('batch_size', input_shape[0].get_length())
+        super().__init__(**kwargs)
+
+    def forward(self, batch):
+        return self.compiled([batch])[self.output]
+
+
+def default_model_path(backend, pt_path, precision='fp32'):
+    """Where ``export_model.py`` (or ``quantize_model.py`` for int8) writes the model for ``backend``."""
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown model precision: {precision} (expected one of {", ".join(PRECISIONS)})')
+    if precision == 'int8' and backend == 'ultralytics':
+        raise ValueError('int8 precision needs the onnx or openvino backend')
+
+    stem, _ = os.path.splitext(pt_path)
+    suffix = '' if precision == 'fp32' else f'.{precision}'
+    if backend == 'onnx':
+        return f'{stem}{suffix}.onnx'
+    if backend == 'openvino':
+        folder = f'{stem}_int8_openvino_model' if precision == 'int8' else f'{stem}_openvino_model'
+        return os.path.join(folder, f'{os.path.basename(stem)}.xml')
+    return pt_path
+
+
+def load_detector(backend, model_path, threads=None):
+    if backend == 'ultralytics':
+        return UltralyticsDetector(model_path)
+    if backend == 'onnx':
+        return OnnxDetector(model_path, threads=threads)
+    if backend == 'openvino':
+        return OpenVinoDetector(model_path, threads=threads)
+    raise ValueError(f'Unknown inference backend: {backend} (expected one of {", ".join(BACKENDS)})')
+
+
+def parse_sizes(spec):
+    """``'640x480,1920x1080'`` -> ``[(640, 480), (1920, 1080)]`` (width x height)."""
+    return [tuple(int(v) for v in size.lower().split('x')) for size in spec.split(',') if size.strip()]
+
+
+def warm_up(run, sizes, batch_size=1):
+    """Run synthetic passes so lazy graph setup and allocations happen before real traffic.
+
+    ``run`` has the detector contract (list of BGR images in, detections out). Each
+    ``(width, height)`` gets a single-image pass; the first also gets a full batch.
+    Returns the elapsed seconds.
+    """
+    start = time.perf_counter()
+    for i, (width, height) in enumerate(sizes):
+        image = np.full((height, width, 3), 114, dtype=np.uint8)
+        run([image])
+        if i == 0 and batch_size > 1:
+            run([image] * batch_size)
+    return time.perf_counter() - start
+
+
+# ---------------- WORKER POOL ----------------
+def split_cpus(num_workers):
+    """Partition the CPUs this process may run on into ``num_workers`` contiguous slices."""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    per_worker = max(1, len(cpus) // num_workers)
+    return [cpus[i * per_worker:(i + 1) * per_worker] or cpus for i in range(num_workers)]
+
+
+def _worker_main(worker_id, backend, model_path, cpus, task_queue, result_queue, warmup_sizes=(), warmup_batch=1):
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    threads = max(1, len(cpus))
+    if backend == 'ultralytics':
+        import torch
+        torch.set_num_threads(threads)
+    start = time.perf_counter()
+    detector = load_detector(backend, model_path, threads=threads)
+    timings = {'model_load_s': round(time.perf_counter() - start, 3)}
+    if warmup_sizes:
+        timings['warmup_s'] = round(warm_up(detector, warmup_sizes, warmup_batch), 3)
+    result_queue.put(('ready', worker_id, timings))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        task_id, items = task
+        # Lets the parent fail this task (and free its segments) if the worker dies mid-batch
+        result_queue.put(('start', worker_id, task_id))
+        try:
+            images = []
+            for name, shape, dtype in items:
+                shm = shared_memory.SharedMemory(name=name)
+                # The parent owns and unlinks the segment; don't let this attach register it too
+                resource_tracker.unregister(shm._name, 'shared_memory')
+                try:
+                    # Copy out so the segment can be closed even if the model keeps references
+                    images.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy())
+                finally:
+                    shm.close()
+
+            result_queue.put((task_id, detector(images), None))
+        except Exception as e:
+            result_queue.put((task_id, None, f'{type(e).__name__}: {e}'))
+
+
+class InferencePool:
+    """Pool of detector-holding worker processes fed through a shared task queue.
+
+    ``run_batch(images)`` has the same contract as a detector backend. A batch whose
+    worker dies fails with RuntimeError; one that takes longer than ``task_timeout``
+    seconds fails with TimeoutError.
+    """
+
+    def __init__(self, backend, model_path, num_workers, warmup_sizes=(), warmup_batch=1, task_timeout=60.0):
+        # fork keeps start-up cheap and avoids re-importing the Flask app in every worker
+        self._ctx = mp.get_context('fork')
+        self.num_workers = num_workers
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._running = {}  # worker_id -> task_id it is working on
+        self.task_timeout = task_timeout
+        self.workers_ready = 0
+        self.worker_timings = {}
+
+        self._processes = []
+        for worker_id, cpus in enumerate(split_cpus(num_workers)):
+            process = self._ctx.Process(
+                target=_worker_main,
+                args=(worker_id, backend, model_path, cpus, self._task_queue, self._result_queue,
+                      warmup_sizes, warmup_batch),
+                name=f'inference-worker-{worker_id}',
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+        # Start threads only after forking so the children inherit a single-threaded parent
+        self._listener = threading.Thread(target=self._collect_results, name='inference-results', daemon=True)
+        self._listener.start()
+
+    @staticmethod
+    def available():
+        return 'fork' in mp.get_all_start_methods()
+
+    def submit_batch(self, images):
+        future = Future()
+        segments, items = [], []
+        try:
+            for image in images:
+                image = np.ascontiguousarray(image)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+                segments.append(shm)
+                np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+                items.append((shm.name, image.shape, image.dtype.str))
+        except Exception:
+            self._release(segments)
+            raise
+
+        task_id = next(self._task_ids)
+        future.task_id = task_id
+        with self._lock:
+            self._pending[task_id] = (future, segments)
+        self._task_queue.put((task_id, items))
+        return future
+
+    def ready(self):
+        return self.workers_ready >= self.num_workers
+
+    def run_batch(self, images):
+        future = self.submit_batch(images)
+        try:
+            return future.result(timeout=self.task_timeout)
+        except FutureTimeoutError:
+            # Also covers a worker lost before its 'start' message got out; a late result is ignored
+            self._fail_task(future.task_id, f'Inference batch took longer than {self.task_timeout}s', TimeoutError)
+            raise TimeoutError(f'Inference batch took longer than {self.task_timeout}s')
+
+    def _collect_results(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                task_id, detections, error = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                task_id = None
+            except (EOFError, OSError):
+                return
+
+            if task_id is None or time.monotonic() - last_check >= 1.0:
+                last_check = time.monotonic()
+                self._check_workers()
+            if task_id is None:
+                continue
+
+            if task_id == 'ready':
+                # ('ready', worker_id, timings): the worker has loaded and warmed its model
+                worker_id, timings = detections, error
+                self.workers_ready += 1
+                self.worker_timings[worker_id] = timings
+                continue
+            if task_id == 'start':
+                # ('start', worker_id, task_id): the worker has taken a batch off the queue
+                worker_id, started_task = detections, error
+                with self._lock:
+                    if started_task in self._pending:
+                        self._running[worker_id] = started_task
+                continue
+
+            with self._lock:
+                for worker_id, running_task in list(self._running.items()):
+                    if running_task == task_id:
+                        del self._running[worker_id]
+                future, segments = self._pending.pop(task_id, (None, []))
+            self._release(segments)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(detections)
+
+    def _check_workers(self):
+        """Fail the batch a dead worker was running; everything once no worker is left."""
+        if not any(p.is_alive() for p in self._processes):
+            self._fail_pending('All inference workers have exited')
+            return
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            with self._lock:
+                task_id = self._running.pop(worker_id, None)
+            if task_id is not None:
+                self._fail_task(task_id, f'Inference worker {worker_id} exited (code {process.exitcode}) mid-batch')
+
+    def _fail_task(self, task_id, message, exc_type=RuntimeError):
+        with self._lock:
+            future, segments = self._pending.pop(task_id, (None, []))
+        self._release(segments)
+        if future is not None and not future.done():
+            future.set_exception(exc_type(message))
+
+    def _fail_pending(self, message):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._running.clear()
+        for future, segments in pending.values():
+            self._release(segments)
+            future.set_exception(RuntimeError(message))
+
+    @staticmethod
+    def _release(segments):
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    def info(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'workers': self.num_workers,
+            'workers_ready': self.workers_ready,
+            'workers_alive': sum(p.is_alive() for p in self._processes),
+            'worker_timings': dict(self.worker_timings),
+            'pending_batches': pending
+        }
+
+    def close(self):
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
@@ -0,0 +1,312 @@
+"""
+Open-loop HTTP load generator shaped like real school-upload traffic.
+
+    # Step through arrival rates until errors appear (services started locally)
+    python load_generator.py sweep --spawn --rates 1,2,4,8,16,32 --step-duration 30
+    # A 30-minute lunch window of 400 schools x 8 classes, replayed 60x faster
+    python load_generator.py lunch --spawn --schools 400 --classes 8 --time-scale 60
+    # Against running services
+    python load_generator.py sweep --upload-url http://localhost:5001 --count-url http://localhost:8080
+
+Each request is a /upload-and-process or a /count-students call (--mix). The image
+is drawn from the local corpus by resolution bucket (--resolution-mix). A share of
+requests re-send a photo that was already sent (--repeat-ratio), like teachers
+re-uploading. Everything else gets unique bytes, so the services' caches only see
+the repeats. count_students fetches images from a local static stand-in
+(benchmark.ImageStandIn).
+
+Arrivals follow a fixed schedule (open loop). Latency is measured from each
+request's scheduled time, so a saturated service shows up as growing latency
+rather than as a politely slower client.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchmark import ImageStandIn, load_corpus, start_service, wait_ready
+
+KINDS = ('upload', 'count')
+
+
+def parse_weights(spec):
+    """``'upload=0.7,count=0.3'`` -> ``{'upload': 0.7, 'count': 0.3}``."""
+    weights = {}
+    for part in spec.split(','):
+        if part.strip():
+            name, _, weight = part.rpartition('=')
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+class TrafficMix:
+    """Draws ``(kind, image_index, tag)`` requests; repeats reuse an earlier tag (same bytes/URL)."""
+
+    def __init__(self, corpus, mix, resolution_mix, repeat_ratio, seed):
+        self.rng = random.Random(seed)
+        self.kinds = [k for k in KINDS if mix.get(k)]
+        self.kind_weights = [mix[k] for k in self.kinds]
+        by_bucket = {}
+        for index, (_, _, bucket) in enumerate(corpus):
+            by_bucket.setdefault(bucket, []).append(index)
+        if resolution_mix:
+            self.buckets = [b for b in resolution_mix if b in by_bucket]
+            self.bucket_weights = [resolution_mix[b] for b in self.buckets]
+        else:
+            # The corpus' own resolution distribution
+            self.buckets = list(by_bucket)
+            self.bucket_weights = [len(by_bucket[b]) for b in self.buckets]
+        if not self.buckets or not self.kinds:
+            raise SystemExit('Nothing to send: check --mix / --resolution-mix against the corpus')
+        self.by_bucket = by_bucket
+        self.repeat_ratio = repeat_ratio
+        self.history = {kind: [] for kind in KINDS}
+        self.counter = 0
+
+    def next(self):
+        kind = self.rng.choices(self.kinds, self.kind_weights)[0]
+        history = self.history[kind]
+        if history and self.rng.random() < self.repeat_ratio:
+            return (kind, *self.rng.choice(history), True)
+        bucket = self.rng.choices(self.buckets, self.bucket_weights)[0]
+        index = self.rng.choice(self.by_bucket[bucket])
+        self.counter += 1
+        tag = f'load-{self.counter}'
+        history.append((index, tag))
+        return kind, index, tag, False
+
+
+class LoadRunner:
+    def __init__(self, args, corpus, stand_in):
+        self.args = args
+        self.corpus = corpus
+        self.stand_in = stand_in
+        self._local = threading.local()
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, kind, index, tag):
+        name, data, _ = self.corpus[index]
+        if kind == 'upload':
+            response = self.session().post(
+                f'{self.args.upload_url}/upload-and-process', params={'response': self.args.response},
+                files={'image': (name, data + b'\0' + tag.encode())}, timeout=self.args.timeout)
+        else:
+            response = self.session().post(
+                f'{self.args.count_url}/count-students', json={'imageUrl': self.stand_in.url(index, tag)},
+                timeout=self.args.timeout)
+        return response.status_code
+
+    def run(self, schedule):
+        """Fire ``[(offset_s, (kind, index, tag, repeat))]`` on time; returns one sample per request."""
+        samples = []
+        lock = threading.Lock()
+
+        def fire(scheduled, request):
+            kind, index, tag, repeat = request
+            try:
+                status = self.send(kind, index, tag)
+            except requests.Timeout:
+                status = 'timeout'
+            except requests.RequestException as e:
+                status = type(e).__name__
+            finished = time.perf_counter()
+            with lock:
+                samples.append({'scheduled': scheduled - started, 'latency': finished - scheduled,
+                                'finished': finished - started, 'kind': kind,
+                                'bucket': self.corpus[index][2], 'repeat': repeat, 'status': status})
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.max_concurrency) as executor:
+            for offset, request in schedule:
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(fire, started + offset, request)
+        return samples
+
+
+def window_stats(samples, duration, elapsed=None):
+    """Offered/achieved rate, latency percentiles and error rate for one slice of samples.
+
+    Offered load is spread over the scheduled ``duration``; achieved throughput over
+    ``elapsed`` (until the last response), which is longer once the service falls behind.
+    """
+    ok = [s['latency'] * 1000 for s in samples if s['status'] == 200]
+    errors = len(samples) - len(ok)
+    elapsed = elapsed or duration
+    stats = {
+        'requests': len(samples),
+        'offered_rps': round(len(samples) / duration, 2) if duration else 0.0,
+        'achieved_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'p50_ms': None, 'p95_ms': None, 'p99_ms': None
+    }
+    if ok:
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+        stats.update(p50_ms=round(float(p50), 1), p95_ms=round(float(p95), 1), p99_ms=round(float(p99), 1))
+    return stats
+
+
+def print_row(label, stats):
+    fmt = lambda v: f'{v:9.1f}' if v is not None else f"{'-':>9}"
+    print(f"{label:>14} {stats['requests']:6d} {stats['offered_rps']:8.2f} {stats['achieved_rps']:8.2f} "
+          f"{fmt(stats['p50_ms'])} {fmt(stats['p95_ms'])} {fmt(stats['p99_ms'])} {stats['error_rate'] * 100:6.1f}%")
+
+
+def print_header(label):
+    print(f"{label:>14} {'n':>6} {'offered':>8} {'achieved':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+
+def is_breaking(stats, args):
+    if stats['error_rate'] > args.max_error_rate:
+        return True
+    return args.slo_ms is not None and stats['p95_ms'] is not None and stats['p95_ms'] > args.slo_ms
+
+
+def run_sweep(args, runner, mix):
+    """Poisson arrivals at each rate in turn: the latency-vs-throughput curve."""
+    rng = random.Random(args.seed)
+    curve, knee = [], None
+    print_header('rate (req/s)')
+    for rate in [float(r) for r in args.rates.split(',')]:
+        schedule, offset = [], rng.expovariate(rate)
+        while offset < args.step_duration:
+            schedule.append((offset, mix.next()))
+            offset += rng.expovariate(rate)
+        samples = runner.run(schedule)
+        elapsed = max([args.step_duration] + [s['finished'] for s in samples])
+        stats = {'rate': rate, **window_stats(samples, args.step_duration, elapsed)}
+        curve.append(stats)
+        print_row(f'{rate:g}', stats)
+        if knee is None and is_breaking(stats, args):
+            knee = rate
+            print(f"⚠️  Errors / SLO breach first appear at {rate:g} req/s")
+            if not args.keep_going:
+                break
+    if knee is None:
+        print("✅ No errors or SLO breaches at any tested rate")
+    return {'curve': curve, 'breaking_rate': knee}
+
+
+def run_lunch(args, runner, mix):
+    """One compressed lunch window: uploads bunched towards the peak of a triangular profile."""
+    rng = random.Random(args.seed)
+    window = args.window_minutes * 60 / args.time_scale
+    total = args.schools * args.classes
+    arrivals = sorted(rng.triangular(0, window, window * args.peak) for _ in range(total))
+    schedule = [(offset, mix.next()) for offset in arrivals]
+    print(f"🍱 {total} requests over {args.window_minutes} min (replayed in {window:.0f}s), "
+          f"peak {total / window * 2:.1f} req/s at {args.peak:.0%} of the window")
+
+    samples = runner.run(schedule)
+    slices = []
+    slice_length = window / args.slices
+    print_header('window minute')
+    for i in range(args.slices):
+        in_slice = [s for s in samples if i * slice_length <= s['scheduled'] < (i + 1) * slice_length]
+        stats = {'window_minute': round(i * args.window_minutes / args.slices, 1),
+                 **window_stats(in_slice, slice_length)}
+        slices.append(stats)
+        print_row(f"{stats['window_minute']:g}", stats)
+
+    # Offered load vs latency across slices: where the service starts to break under the spike
+    breaking = next((s for s in sorted(slices, key=lambda s: s['offered_rps']) if is_breaking(s, args)), None)
+    if breaking:
+        print(f"⚠️  Errors / SLO breach first appear at {breaking['offered_rps']} req/s offered "
+              f"(window minute {breaking['window_minute']:g})")
+    else:
+        print("✅ No errors or SLO breaches during the window")
+    overall = window_stats(samples, window, max([window] + [s['finished'] for s in samples]))
+    by_kind = {kind: window_stats([s for s in samples if s['kind'] == kind], window)
+               for kind in KINDS if any(s['kind'] == kind for s in samples)}
+    repeats = window_stats([s for s in samples if s['repeat']], window)
+    return {'slices': slices, 'overall': overall, 'by_kind': by_kind, 'repeats': repeats,
+            'breaking_offered_rps': breaking['offered_rps'] if breaking else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the face services with school-upload traffic')
+    parser.add_argument('profile', choices=['sweep', 'lunch'])
+    parser.add_argument('--upload-url', default='http://localhost:5001', help='flask_app.py base URL')
+    parser.add_argument('--count-url', default='http://localhost:8080', help='yolo-service base URL')
+    parser.add_argument('--spawn', action='store_true', help='start both services locally with scratch folders')
+    parser.add_argument('--images', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+    parser.add_argument('--mix', default='upload=0.7,count=0.3', help='request kind weights')
+    parser.add_argument('--resolution-mix', help="e.g. '<=1280=0.6,<=1920=0.3,<=3840=0.1' (default: corpus mix)")
+    parser.add_argument('--repeat-ratio', type=float, default=0.15, help='share of requests re-sending a photo')
+    parser.add_argument('--response', choices=['full', 'urls', 'bbox'], default='full')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='client-side cap on open requests')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--storage-latency-ms', type=float, default=50, help='delay added by the image stand-in')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='error rate that counts as breaking')
+    parser.add_argument('--slo-ms', type=float, help='p95 latency that counts as breaking')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    sweep = parser.add_argument_group('sweep')
+    sweep.add_argument('--rates', default='1,2,4,8,16,32', help='arrival rates (req/s) to step through')
+    sweep.add_argument('--step-duration', type=float, default=30, help='seconds per rate')
+    sweep.add_argument('--keep-going', action='store_true', help='keep stepping after the first breaking rate')
+    lunch = parser.add_argument_group('lunch')
+    lunch.add_argument('--schools', type=int, default=200)
+    lunch.add_argument('--classes', type=int, default=8, help='photos per school')
+    lunch.add_argument('--window-minutes', type=float, default=30)
+    lunch.add_argument('--peak', type=float, default=0.4, help='where in the window traffic peaks (0-1)')
+    lunch.add_argument('--time-scale', type=float, default=30, help='replay speed-up of the window')
+    lunch.add_argument('--slices', type=int, default=10, help='report rows across the window')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.images)
+    if not corpus:
+        raise SystemExit(f'No images found in {args.images}')
+    mix = parse_weights(args.mix)
+    resolution_mix = parse_weights(args.resolution_mix) if args.resolution_mix else None
+    traffic = TrafficMix(corpus, mix, resolution_mix, args.repeat_ratio, args.seed)
+
+    stand_in = ImageStandIn([data for _, data, _ in corpus], args.storage_latency_ms)
+    processes = []
+    try:
+        if args.spawn:
+            scratch = tempfile.mkdtemp(prefix='face-load-')
+            env = dict(os.environ,
+                       UPLOAD_FOLDER=os.path.join(scratch, 'uploads'),
+                       CACHE_FOLDER=os.path.join(scratch, 'cache'),
+                       INDEX_DB_PATH=os.path.join(scratch, 'uploads.db'),
+                       ANNOTATED_CACHE_FOLDER=os.path.join(scratch, 'annotated_cache'),
+                       FETCH_CACHE_FOLDER=os.path.join(scratch, 'fetch_cache'))
+            for kind, target in (('upload', 'upload-http'), ('count', 'count-http')):
+                if mix.get(kind):
+                    process, url = start_service(target, env)
+                    processes.append(process)
+                    wait_ready(url, process)
+                    setattr(args, f'{kind}_url', url)
+                    print(f"🚀 Started {target} at {url}")
+        runner = LoadRunner(args, corpus, stand_in)
+        result = run_sweep(args, runner, traffic) if args.profile == 'sweep' else run_lunch(args, runner, traffic)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        stand_in.close()
+
+    if args.json:
+        settings = {k: v for k, v in vars(args).items() if k != 'json'}
+        with open(args.json, 'w') as f:
+            json.dump({'profile': args.profile, 'settings': settings, **result}, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
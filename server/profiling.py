@@ -0,0 +1,199 @@
+"""
+Per-request profiling: a stack sampler plus cProfile, written to a capped folder.
+
+    result, profile = profile_call(lambda: view(), interval_ms=1)
+    store.save('upload_and_process', profile)  # -> <id>.speedscope.json + <id>.prof
+
+The sampler thread reads the profiled thread's stack through ``sys._current_frames``
+every ``interval_ms`` and the result is saved as a speedscope "sampled" profile
+(open it at https://www.speedscope.app). cProfile runs on the same call for exact
+call counts (``python -m pstats <id>.prof`` or snakeviz), on the calling thread only.
+
+Work the call hands to other threads is sampled too when those threads ``attach``
+to ``current_sampler()`` while they run it: the inference batcher does this for
+batches holding the request's images, which then show up as their own profile in
+the same speedscope file, with per-batch timings saved to ``<id>.batches.json``.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+_active = threading.local()
+
+
+def current_sampler():
+    """The sampler profiling the calling thread (inside ``profile_call``), else None."""
+    return getattr(_active, 'sampler', None)
+
+
+class StackSampler:
+    """Samples a thread's Python stack at a fixed interval; counts identical stacks.
+
+    Other threads can ``attach`` for a while (e.g. while running this request's
+    batch); their stacks are counted under their own label.
+    """
+
+    def __init__(self, thread_id, interval_ms=1.0):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = {}  # (label, stack) -> count
+        self.samples = 0
+        self.ticks = 0
+        self.batches = []
+        self._attached = {}  # thread id -> label
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def attach(self, thread_id, label):
+        with self._lock:
+            self._attached[thread_id] = label
+
+    def detach(self, thread_id):
+        with self._lock:
+            self._attached.pop(thread_id, None)
+
+    def record_batch(self, **timings):
+        with self._lock:
+            self.batches.append(timings)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = [(self.thread_id, 'request')] + list(self._attached.items())
+            self.ticks += 1
+            for thread_id, label in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    stack.reverse()  # root first
+                    key = (label, tuple(stack))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+                    if thread_id == self.thread_id:
+                        self.samples += 1
+
+
+def to_speedscope(name, sampler):
+    """Speedscope JSON: one sampled profile per thread label, each sample weighted by its share of wall time."""
+    frames, frame_index = [], {}
+    profiles = {}
+    weight = sampler.elapsed * 1000 / sampler.ticks if sampler.ticks else 0.0
+    for (label, stack), count in sampler.stacks.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            indices.append(frame_index[frame])
+        samples, weights = profiles.setdefault(label, ([], []))
+        samples.append(indices)
+        weights.append(round(count * weight, 3))
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'flask_app profiling',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f'{name} ({label})',
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(sampler.elapsed * 1000, 3),
+            'samples': samples,
+            'weights': weights
+        } for label, (samples, weights) in sorted(profiles.items(), key=lambda item: item[0] != 'request')]
+    }
+
+
+# cProfile hooks are process-wide (Python 3.12+ refuses a second active profiler)
+_cprofile_lock = threading.Lock()
+
+
+def profile_call(func, interval_ms=1.0):
+    """Run ``func()`` under the sampler and cProfile; returns ``(result, profile)``.
+
+    ``profile`` holds the sampler and the cProfile object for ``ProfileStore.save``.
+    While another call holds cProfile, this one is sampled only (``cprofile`` is None).
+    """
+    sampler = StackSampler(threading.get_ident(), interval_ms)
+    profiler = None
+    previous, _active.sampler = current_sampler(), sampler
+    sampler.start()
+    try:
+        if _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # some other profiler (e.g. a debugger) is active
+                profiler = None
+                _cprofile_lock.release()
+        result = func()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _cprofile_lock.release()
+        sampler.stop()
+        _active.sampler = previous
+    return result, {'sampler': sampler, 'cprofile': profiler}
+
+
+class ProfileStore:
+    """Folder of saved profiles, keeping only the newest ``max_profiles``."""
+
+    def __init__(self, folder, max_profiles=50):
+        self.folder = folder
+        self.max_profiles = max(1, max_profiles)
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def new_id(self, label):
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{label}"
+
+    def save(self, profile_id, profile):
+        sampler = profile['sampler']
+        with open(os.path.join(self.folder, f'{profile_id}.speedscope.json'), 'w') as f:
+            json.dump(to_speedscope(profile_id, sampler), f)
+        if sampler.batches:
+            with open(os.path.join(self.folder, f'{profile_id}.batches.json'), 'w') as f:
+                json.dump(sampler.batches, f, indent=1)
+        if profile['cprofile'] is not None:
+            profile['cprofile'].dump_stats(os.path.join(self.folder, f'{profile_id}.prof'))
+        self.prune()
+
+    def prune(self):
+        with self._lock:
+            groups = {}
+            for name in os.listdir(self.folder):
+                groups.setdefault(name.split('.', 1)[0], []).append(name)
+            # Ids start with a timestamp, so name order is age order
+            for profile_id in sorted(groups)[:-self.max_profiles]:
+                for name in groups[profile_id]:
+                    try:
+                        os.remove(os.path.join(self.folder, name))
+                    except OSError:
+                        pass
+
+    def info(self):
+        return {'folder': self.folder, 'max_profiles': self.max_profiles,
+                'profiles': len({name.split('.', 1)[0] for name in os.listdir(self.folder)})}
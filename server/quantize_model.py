@@ -0,0 +1,166 @@
+"""
+Build an INT8 version of the ONNX face model and report what it costs / saves.
+
+    # 1. FP32 ONNX export (once)
+    python export_model.py --format onnx
+    # 2. Static INT8, calibrated on local photos
+    python quantize_model.py quantize --calibration-images uploads
+    # 3. Per-image latency and face-count deltas, INT8 vs FP32
+    python quantize_model.py report --images uploads --json int8_report.json
+
+Serve the result with INFERENCE_BACKEND=onnx MODEL_PRECISION=int8 (server and yolo-service).
+For OpenVINO, export with ``yolo export format=openvino int8=True`` instead; the
+report command works for either backend.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from check_backend_parity import compare, iter_images
+from inference import ExportedDetector, default_model_path, load_detector
+
+
+class ImageCalibrationReader:
+    """Feeds letterboxed local images to the ONNX Runtime static quantizer."""
+
+    def __init__(self, input_name, folder, limit, imgsz):
+        self.input_name = input_name
+        self.preprocessor = ExportedDetector(imgsz=imgsz)
+        self._images = iter_images(folder, limit)
+
+    def get_next(self):
+        for _, image in self._images:
+            batch, _ = self.preprocessor.preprocess([image])
+            return {self.input_name: batch}
+        return None
+
+
+def quantize(args):
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    fp32_path = args.fp32_model or default_model_path('onnx', args.model)
+    int8_path = args.output or default_model_path('onnx', args.model, 'int8')
+
+    # Shape inference + graph cleanup gives the quantizer a simpler graph to work on
+    prepared_path = fp32_path.replace('.onnx', '.prep.onnx')
+    quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+
+    print(f"⚙️  {args.method} INT8 quantization: {fp32_path} -> {int8_path}")
+    if args.method == 'dynamic':
+        quantize_dynamic(prepared_path, int8_path, weight_type=QuantType.QUInt8)
+    else:
+        session = ort.InferenceSession(prepared_path, providers=['CPUExecutionProvider'])
+        model_input = session.get_inputs()[0]
+        imgsz = model_input.shape[2] if isinstance(model_input.shape[2], int) else args.imgsz
+        reader = ImageCalibrationReader(model_input.name, args.calibration_images, args.calibration_limit, imgsz)
+        quantize_static(prepared_path, int8_path, reader,
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=True)
+    os.remove(prepared_path)
+    print(f"✅ Wrote {int8_path}")
+
+
+def time_detector(detector, image, repeat):
+    detector([image])  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detections = detector([image])[0]
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), detections
+
+
+def report(args):
+    fp32_path = args.fp32_model or default_model_path(args.backend, args.model)
+    int8_path = args.int8_model or default_model_path(args.backend, args.model, 'int8')
+    fp32 = load_detector(args.backend, fp32_path)
+    int8 = load_detector(args.backend, int8_path)
+
+    rows = []
+    print(f"{'image':50} {'fp32 ms':>8} {'int8 ms':>8} {'speedup':>7} {'fp32 n':>6} {'int8 n':>6} {'Δn':>4}")
+    for name, image in iter_images(args.images, args.limit):
+        fp32_ms, fp32_det = time_detector(fp32, image, args.repeat)
+        int8_ms, int8_det = time_detector(int8, image, args.repeat)
+        fp32_count = int((fp32_det[1] >= args.count_conf).sum())
+        int8_count = int((int8_det[1] >= args.count_conf).sum())
+        _, mean_iou, _ = compare(fp32_det, int8_det, match_iou=0.5)
+        rows.append({
+            'image': name,
+            'height': image.shape[0],
+            'width': image.shape[1],
+            'fp32_ms': round(fp32_ms, 2),
+            'int8_ms': round(int8_ms, 2),
+            'fp32_faces': fp32_count,
+            'int8_faces': int8_count,
+            'face_count_delta': int8_count - fp32_count,
+            'mean_iou': round(mean_iou, 4)
+        })
+        print(f"{name[:50]:50} {fp32_ms:8.1f} {int8_ms:8.1f} {fp32_ms / int8_ms:6.2f}x "
+              f"{fp32_count:6d} {int8_count:6d} {int8_count - fp32_count:+4d}")
+
+    if not rows:
+        print("No images found")
+        return
+
+    deltas = np.array([r['face_count_delta'] for r in rows])
+    summary = {
+        'backend': args.backend,
+        'fp32_model': fp32_path,
+        'int8_model': int8_path,
+        'images': len(rows),
+        'fp32_median_ms': statistics.median(r['fp32_ms'] for r in rows),
+        'int8_median_ms': statistics.median(r['int8_ms'] for r in rows),
+        'speedup': round(sum(r['fp32_ms'] for r in rows) / sum(r['int8_ms'] for r in rows), 3),
+        'mean_abs_face_count_delta': round(float(np.abs(deltas).mean()), 3),
+        'max_abs_face_count_delta': int(np.abs(deltas).max()),
+        'images_with_count_change': int((deltas != 0).sum())
+    }
+    print(f"\n📊 {summary['images']} images: {summary['speedup']}x throughput, "
+          f"mean |Δfaces| {summary['mean_abs_face_count_delta']}, "
+          f"{summary['images_with_count_change']} image(s) changed count")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'images': rows}, f, indent=2)
+        print(f"💾 Saved report to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 face model: build and compare against FP32')
+    parser.add_argument('--model', default='yolov8n-face.pt', help='base model name used to locate exports')
+    parser.add_argument('--fp32-model', help='FP32 model path (defaults to the export location)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    q = subparsers.add_parser('quantize', help='write an INT8 ONNX model')
+    q.add_argument('--method', choices=['static', 'dynamic'], default='static')
+    q.add_argument('--calibration-images', default='uploads')
+    q.add_argument('--calibration-limit', type=int, default=100)
+    q.add_argument('--imgsz', type=int, default=640)
+    q.add_argument('--output', help='INT8 model path')
+    q.set_defaults(func=quantize)
+
+    r = subparsers.add_parser('report', help='per-image latency and face-count deltas vs FP32')
+    r.add_argument('--backend', choices=['onnx', 'openvino'], default='onnx')
+    r.add_argument('--int8-model', help='INT8 model path (defaults to the quantize output)')
+    r.add_argument('--images', default='uploads')
+    r.add_argument('--limit', type=int)
+    r.add_argument('--repeat', type=int, default=5, help='timed runs per image (median is reported)')
+    r.add_argument('--count-conf', type=float, default=0.25, help='confidence at which a box counts as a face')
+    r.add_argument('--json', help='also write the full report to this file')
+    r.set_defaults(func=report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,202 @@
-from flask import Flask, request, jsonify
+import time
+BOOT_STARTED = time.perf_counter()  # boot timing covers the heavy imports below
+
+from flask import Flask, Response, g, request, jsonify
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import requests
-from io import BytesIO
-from PIL import Image, ImageDraw
 import os
 import base64
+import hashlib
+import threading
+from detectors import BACKENDS, default_model_path, load_detector, parse_sizes, warm_up
+from fetcher import (FETCH_CACHE_ENABLED, FETCH_CACHE_FOLDER, FETCH_CACHE_MAX_BYTES, FetchCache, FetchError,
+                     decode_image, fetch_image_bytes)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+
+boot = {'ready': False, 'timings': {'import_s': round(time.perf_counter() - BOOT_STARTED, 3)}}
 
 app = Flask(__name__)
 
+# Prometheus-style metrics served from /metrics
+metrics = Registry()
+REQUESTS = metrics.counter('yolo_service_requests_total', 'HTTP requests by endpoint and status',
+                           ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = metrics.histogram('yolo_service_request_duration_seconds', 'HTTP request latency', ('endpoint',))
+IN_FLIGHT = metrics.gauge('yolo_service_requests_in_flight', 'Requests currently being handled')
+STAGE_SECONDS = metrics.histogram('yolo_service_stage_duration_seconds',
+                                  'Time spent per count-students stage', ('stage',))
+INFERENCE_SECONDS = metrics.histogram('yolo_service_inference_duration_seconds', 'Model call time per image')
+FETCH_RESULTS = metrics.counter('yolo_service_fetch_results_total',
+                                'Image fetches by outcome (downloaded, not_modified, unchanged_content)',
+                                ('outcome',))
+metrics.gauge('yolo_service_ready', '1 once the model is loaded and warmed', func=lambda: int(boot['ready']))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    IN_FLIGHT.dec()
+
+# Inference backend: ultralytics (PyTorch), onnx or openvino -- see detectors.py
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'ultralytics')
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'fp32')  # int8 = quantized onnx/openvino model
+MODEL_PATH = os.environ.get('MODEL_PATH') or default_model_path(INFERENCE_BACKEND, 'yolov8n-face.pt', MODEL_PRECISION)
+if INFERENCE_BACKEND not in BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {', '.join(BACKENDS)}, got {INFERENCE_BACKEND!r}")
+# Synthetic passes at these WxH sizes before /health/ready reports ready (WARMUP=0 skips them)
+WARMUP = os.environ.get('WARMUP', '1') != '0'
+WARMUP_SIZES = parse_sizes(os.environ.get('WARMUP_SIZES', '640x640,1920x1080'))
+# async_app.py sets this to 0 before importing this module: it loads one model per inference thread
+LOAD_SHARED_MODEL = os.environ.get('LOAD_SHARED_MODEL', '1') != '0'
+
 # Load YOLOv8n-face model for face detection
-try:
-    # Try to load YOLOv8n-face model (better for face detection)
-    model = YOLO('yolov8n-face.pt')
-except:
-    # Fallback to regular YOLOv8n if face model not available
-    model = YOLO('yolov8n.pt')
+def load_model():
+    if INFERENCE_BACKEND == 'ultralytics':
+        try:
+            # Try to load YOLOv8n-face model (better for face detection)
+            return load_detector(INFERENCE_BACKEND, MODEL_PATH)
+        except:
+            # Fallback to regular YOLOv8n if face model not available
+            return load_detector(INFERENCE_BACKEND, 'yolov8n.pt')
+    return load_detector(INFERENCE_BACKEND, MODEL_PATH)
+
+def mark_ready():
+    boot['timings']['total_s'] = round(time.perf_counter() - BOOT_STARTED, 3)
+    boot['ready'] = True
+    print("Boot: " + ", ".join(f"{name[:-2].replace('_', ' ')} {value}s" for name, value in boot['timings'].items()))
+
+def warm_up_model():
+    """Warm the model in the background; /health/ready answers 503 until it is done."""
+    try:
+        if WARMUP:
+            boot['timings']['warmup_s'] = round(warm_up(detector, WARMUP_SIZES), 3)
+    except Exception as e:
+        boot['error'] = str(e)
+        print(f"Model warm-up failed: {e}")
+        return
+    mark_ready()
+
+detector = None
+if LOAD_SHARED_MODEL:
+    model_load_started = time.perf_counter()
+    detector = load_model()
+    boot['timings']['model_load_s'] = round(time.perf_counter() - model_load_started, 3)
+    threading.Thread(target=warm_up_model, name='model-warmup', daemon=True).start()
+
+# Cached results are only reused while the same model is loaded
+MODEL_ID = f"{INFERENCE_BACKEND}:{MODEL_PRECISION}:{MODEL_PATH}"
+fetch_cache = FetchCache(FETCH_CACHE_FOLDER, FETCH_CACHE_MAX_BYTES) if FETCH_CACHE_ENABLED else None
+
+def detect_students(cv_image, model=None):
+    """Run face detection on a BGR image and build the /count-students result.
+
+    ``model`` overrides the shared detector (async_app passes its inference thread's own).
+    """
+    # Run YOLO detection (face classes only, original image coordinates)
+    with INFERENCE_SECONDS.time():
+        boxes_xyxy, confidences = (model or detector)([cv_image])[0]
+
+    # Keep faces with confidence > 0.5 (one mask over all boxes)
+    keep = confidences > 0.5
+    boxes_xyxy, confidences = boxes_xyxy[keep], confidences[keep]
+    face_count = len(confidences)
+
+    detected_faces = [{'bbox': bbox, 'confidence': conf}
+                      for bbox, conf in zip(boxes_xyxy.astype(float).tolist(),
+                                            confidences.astype(float).tolist())]
+
+    # Draw all red face boxes in one call on the BGR image
+    with STAGE_SECONDS.time(stage='draw'):
+        corners = np.rint(boxes_xyxy).astype(np.int32)[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(cv_image, list(corners), True, (0, 0, 255), 3)
+
+    # Convert annotated image to base64 for return
+    with STAGE_SECONDS.time(stage='encode'):
+        _, buffer = cv2.imencode('.jpg', cv_image)
+        annotated_image_b64 = base64.b64encode(buffer).decode()
+
+    return {
+        'studentCount': int(face_count),
+        'confidence': 0.85,
+        'processed': True,
+        'detectedFaces': detected_faces,
+        'annotatedImage': f'data:image/jpeg;base64,{annotated_image_b64}'
+    }
+
+def count_image_url(image_url):
+    """Fetch and count one image URL, revalidating against the fetch cache when enabled."""
+    cached = fetch_cache.get(image_url) if fetch_cache else None
+    validators = {k: cached.get(k) for k in ('etag', 'last_modified')} if cached else {}
+
+    # Stream the image over the shared keep-alive session (timeouts + size cap);
+    # a cached URL is fetched conditionally and comes back empty when unchanged
+    with STAGE_SECONDS.time(stage='fetch'):
+        data, validators = fetch_image_bytes(image_url, **validators)
+    if data is None:
+        if cached['model'] == MODEL_ID:
+            FETCH_RESULTS.inc(outcome='not_modified')
+            fetch_cache.record_hit('not_modified')
+            fetch_cache.put(image_url, None, {**cached, **validators})
+            return {**cached['result'], 'cached': True}
+        data = fetch_cache.read_image(image_url)
+        if data is None:
+            # Evicted since get(): a plain download, as for an uncached URL
+            cached = None
+            with STAGE_SECONDS.time(stage='fetch'):
+                data, validators = fetch_image_bytes(image_url)
+
+    digest = hashlib.sha256(data).hexdigest()
+    if cached and cached['content_hash'] == digest and cached['model'] == MODEL_ID:
+        # Server without validators (or a changed ETag) but the same bytes
+        FETCH_RESULTS.inc(outcome='unchanged_content')
+        fetch_cache.record_hit('unchanged_content')
+        fetch_cache.put(image_url, None, {**cached, **validators})
+        return {**cached['result'], 'cached': True}
+
+    # Decode straight from the downloaded buffer to BGR
+    FETCH_RESULTS.inc(outcome='downloaded')
+    with STAGE_SECONDS.time(stage='decode'):
+        cv_image = decode_image(data)
+    result = detect_students(cv_image)
+    if fetch_cache:
+        fetch_cache.put(image_url, data, {**validators, 'content_hash': digest, 'model': MODEL_ID, 'result': result})
+    return {**result, 'cached': False}
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'})
+    return jsonify({
+        'status': 'healthy',
+        'live': True,
+        'ready': boot['ready'],
+        'boot': boot,
+        'inference_backend': INFERENCE_BACKEND,
+        'model_precision': MODEL_PRECISION,
+        'fetch_cache': fetch_cache.info() if fetch_cache else None
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    if not boot['ready']:
+        return jsonify({'status': 'starting' if 'error' not in boot else 'failed', **boot}), 503
+    return jsonify({'status': 'ready', **boot})
 
 @app.route('/count-students', methods=['POST'])
 def count_students():
@@ -31,80 +207,10 @@ def count_students():
         if not image_url:
             return jsonify({'error': 'No image URL provided'}), 400
 
-        # Download image from URL
-        response = requests.get(image_url)
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to download image'}), 400
-
-        # Convert to PIL Image
-        image = Image.open(BytesIO(response.content))
-
-        # Convert PIL to OpenCV format
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-        # Run YOLO detection
-        results = model(cv_image)
-
-        # Process results and draw bounding boxes
-        face_count = 0
-        detected_faces = []
-
-        # Create a copy of the original image for drawing
-        annotated_image = image.copy()
-        draw = ImageDraw.Draw(annotated_image)
-
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                # Get bounding boxes and confidence scores
-                boxes_xyxy = boxes.xyxy.cpu().numpy()
-                confidences = boxes.conf.cpu().numpy()
-
-                # For YOLOv8n-face, all detections are faces
-                # For regular YOLO, filter for person class (class 0)
-                if hasattr(boxes, 'cls'):
-                    classes = boxes.cls.cpu().numpy()
-                    # Filter for faces/persons with confidence > 0.5
-                    for i, (box, conf, cls) in enumerate(zip(boxes_xyxy, confidences, classes)):
-                        if conf > 0.5 and (cls == 0 or 'face' in str(model.names.get(int(cls), ''))):
-                            face_count += 1
-                            x1, y1, x2, y2 = box
-
-                            # Draw red rectangle around detected face
-                            draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
-
-                            # Store face coordinates
-                            detected_faces.append({
-                                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                                'confidence': float(conf)
-                            })
-                else:
-                    # If no class info, assume all detections are faces
-                    for i, (box, conf) in enumerate(zip(boxes_xyxy, confidences)):
-                        if conf > 0.5:
-                            face_count += 1
-                            x1, y1, x2, y2 = box
-
-                            # Draw red rectangle around detected face
-                            draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
-
-                            detected_faces.append({
-                                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                                'confidence': float(conf)
-                            })
-
-        # Convert annotated image to base64 for return
-        buffer = BytesIO()
-        annotated_image.save(buffer, format='JPEG')
-        annotated_image_b64 = base64.b64encode(buffer.getvalue()).decode()
-
-        return jsonify({
-            'studentCount': int(face_count),
-            'confidence': 0.85,
-            'processed': True,
-            'detectedFaces': detected_faces,
-            'annotatedImage': f'data:image/jpeg;base64,{annotated_image_b64}'
-        })
+        try:
+            return jsonify(count_image_url(image_url))
+        except FetchError as e:
+            return jsonify({'error': str(e)}), e.status
 
     except Exception as e:
         print(f"Error processing image: {str(e)}")
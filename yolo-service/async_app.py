@@ -0,0 +1,259 @@
+"""
+Asyncio (ASGI) variant of the count-students service.
+
+Image downloads run concurrently on the event loop through one pooled
+``httpx.AsyncClient``; decode + detection are handed to a thread pool behind a
+semaphore, so network waits of one request overlap inference of another. Each
+inference thread loads and warms its own model at startup (one shared session
+for onnx); /health/ready answers 503 until all of them are ready.
+Responses and the fetch cache match app.py.
+
+    pip install -r async_requirements.txt
+    uvicorn async_app:app --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Models are loaded per inference thread below; skip app.py's shared (unused) one
+os.environ['LOAD_SHARED_MODEL'] = '0'
+from app import (INFERENCE_BACKEND, MODEL_ID, MODEL_PRECISION, WARMUP, WARMUP_SIZES, boot, detect_students,
+                 fetch_cache, load_model, mark_ready)
+from detectors import warm_up
+from fetcher import (CHUNK_SIZE, FETCH_CONNECT_TIMEOUT, FETCH_MAX_BYTES, FETCH_POOL_SIZE, FETCH_READ_TIMEOUT,
+                     FETCH_TOTAL_TIMEOUT, FetchError, decode_image)
+
+# Images in the model at once. The ultralytics predictor and OpenVINO's compiled model keep
+# per-call state, so each inference thread gets its own model (ONNX Runtime sessions are shared)
+INFERENCE_CONCURRENCY = int(os.environ.get('INFERENCE_CONCURRENCY', 1))
+MAX_CONCURRENT_FETCHES = int(os.environ.get('MAX_CONCURRENT_FETCHES', 64))
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_CONCURRENCY, thread_name_prefix='inference')
+thread_state = threading.local()
+shared_model = None
+shared_model_lock = threading.Lock()
+
+
+def load_thread_model(barrier):
+    """Load and warm the calling executor thread's model.
+
+    Every call waits on ``barrier`` until all INFERENCE_CONCURRENCY calls are in, so
+    each one occupies (and spawns) a different executor thread.
+    """
+    global shared_model
+    try:
+        if INFERENCE_BACKEND == 'onnx':
+            with shared_model_lock:
+                if shared_model is None:
+                    shared_model = load_model()
+            thread_state.model = shared_model
+        else:
+            thread_state.model = load_model()
+        if WARMUP:
+            warm_up(thread_state.model, WARMUP_SIZES)
+    except Exception:
+        barrier.abort()
+        raise
+    barrier.wait()
+
+
+def start_model_loading():
+    """Queue one model load per executor thread, ahead of any request's inference."""
+    barrier = threading.Barrier(INFERENCE_CONCURRENCY)
+    return [inference_executor.submit(load_thread_model, barrier) for _ in range(INFERENCE_CONCURRENCY)]
+
+
+async def finish_boot(loads):
+    """/health/ready reports ready once every inference thread has a warm model."""
+    started = time.perf_counter()
+    try:
+        for load in loads:
+            await asyncio.wrap_future(load)
+    except Exception as e:
+        boot['error'] = str(e)
+        print(f"Model loading failed: {e}")
+        return
+    boot['timings']['models_ready_s'] = round(time.perf_counter() - started, 3)
+    mark_ready()
+
+inference_slots = None
+client = None
+stats = {'in_flight': 0, 'fetching': 0, 'waiting_for_model': 0, 'inferring': 0}
+
+
+async def fetch_image_bytes(url, etag=None, last_modified=None):
+    """Async twin of ``fetcher.fetch_image_bytes``: ``(body or None on 304, validators)``."""
+    if not url.startswith(('http://', 'https://')):
+        raise FetchError('imageUrl must be an http(s) URL')
+
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        return await asyncio.wait_for(download(url, headers, etag, last_modified), FETCH_TOTAL_TIMEOUT)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        raise FetchError('Timed out downloading image', 504)
+    except httpx.HTTPError as e:
+        raise FetchError(f'Failed to download image: {e.__class__.__name__}', 502)
+
+
+async def download(url, headers, etag, last_modified):
+    async with client.stream('GET', url, headers=headers) as response:
+        if response.status_code == 304 and headers:
+            return None, {'etag': response.headers.get('ETag') or etag,
+                          'last_modified': response.headers.get('Last-Modified') or last_modified}
+        if response.status_code != 200:
+            raise FetchError('Failed to download image')
+
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > FETCH_MAX_BYTES:
+            raise FetchError(f'Image larger than {FETCH_MAX_BYTES // (1024 * 1024)}MB', 413)
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > FETCH_MAX_BYTES:
+                raise FetchError(f'Image larger than {FETCH_MAX_BYTES // (1024 * 1024)}MB', 413)
+        return buffer, {'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')}
+
+
+def decode_and_detect(data):
+    return detect_students(decode_image(data), thread_state.model)
+
+
+async def run_inference(data):
+    """Decode + detect in the thread pool, at most INFERENCE_CONCURRENCY at a time."""
+    stats['waiting_for_model'] += 1
+    async with inference_slots:
+        stats['waiting_for_model'] -= 1
+        stats['inferring'] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(inference_executor, decode_and_detect, data)
+        finally:
+            stats['inferring'] -= 1
+
+
+async def count_image_url(image_url):
+    """Same flow as ``app.count_image_url`` with the download and inference awaited."""
+    cached = await asyncio.to_thread(fetch_cache.get, image_url) if fetch_cache else None
+    validators = {k: cached.get(k) for k in ('etag', 'last_modified')} if cached else {}
+
+    stats['fetching'] += 1
+    try:
+        data, validators = await fetch_image_bytes(image_url, **validators)
+    finally:
+        stats['fetching'] -= 1
+
+    if data is None:
+        if cached['model'] == MODEL_ID:
+            fetch_cache.record_hit('not_modified')
+            await asyncio.to_thread(fetch_cache.put, image_url, None, {**cached, **validators})
+            return {**cached['result'], 'cached': True}
+        data = await asyncio.to_thread(fetch_cache.read_image, image_url)
+        if data is None:
+            # Evicted since get(): a plain download, as for an uncached URL
+            cached = None
+            data, validators = await fetch_image_bytes(image_url)
+
+    digest = hashlib.sha256(data).hexdigest()
+    if cached and cached['content_hash'] == digest and cached['model'] == MODEL_ID:
+        fetch_cache.record_hit('unchanged_content')
+        await asyncio.to_thread(fetch_cache.put, image_url, None, {**cached, **validators})
+        return {**cached['result'], 'cached': True}
+
+    result = await run_inference(data)
+    if fetch_cache:
+        entry = {**validators, 'content_hash': digest, 'model': MODEL_ID, 'result': result}
+        await asyncio.to_thread(fetch_cache.put, image_url, data, entry)
+    return {**result, 'cached': False}
+
+
+async def health_check(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'live': True,
+        'ready': boot['ready'],
+        'boot': boot,
+        'inference_backend': INFERENCE_BACKEND,
+        'model_precision': MODEL_PRECISION,
+        'inference_concurrency': INFERENCE_CONCURRENCY,
+        'requests': dict(stats),
+        'fetch_cache': fetch_cache.info() if fetch_cache else None
+    })
+
+
+async def liveness(request):
+    return JSONResponse({'status': 'alive'})
+
+
+async def readiness(request):
+    if not boot['ready']:
+        return JSONResponse({'status': 'starting' if 'error' not in boot else 'failed', **boot}, status_code=503)
+    return JSONResponse({'status': 'ready', **boot})
+
+
+async def count_students(request):
+    try:
+        data = await request.json()
+        image_url = data.get('imageUrl')
+
+        if not image_url:
+            return JSONResponse({'error': 'No image URL provided'}, status_code=400)
+
+        stats['in_flight'] += 1
+        try:
+            return JSONResponse(await count_image_url(image_url))
+        except FetchError as e:
+            return JSONResponse({'error': str(e)}, status_code=e.status)
+        finally:
+            stats['in_flight'] -= 1
+
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return JSONResponse({'error': 'Failed to process image'}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Loop-bound objects are created once the server's event loop is running
+    global client, inference_slots
+    # Submitted before the first request is accepted, so the loads run first on every thread
+    boot_task = asyncio.create_task(finish_boot(start_model_loading()))
+    inference_slots = asyncio.Semaphore(INFERENCE_CONCURRENCY)
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(FETCH_READ_TIMEOUT, connect=FETCH_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=MAX_CONCURRENT_FETCHES, max_keepalive_connections=FETCH_POOL_SIZE),
+        transport=httpx.AsyncHTTPTransport(retries=2)  # connection failures only
+    )
+    yield
+    boot_task.cancel()
+    await client.aclose()
+    inference_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health_check, methods=['GET']),
+        Route('/health/live', liveness, methods=['GET']),
+        Route('/health/ready', readiness, methods=['GET']),
+        Route('/count-students', count_students, methods=['POST']),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
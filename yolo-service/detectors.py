@@ -0,0 +1,216 @@
+"""
+Face detector backends for the count-students service.
+
+Every backend is a callable taking a list of BGR ndarrays and returning one
+``(boxes_xyxy, confidences)`` pair of float32 arrays per image, in original
+image coordinates:
+
+    ultralytics - the PyTorch ``.pt`` model through ``ultralytics.YOLO``
+    onnx        - an exported ``.onnx`` model on ONNX Runtime (CPU)
+    openvino    - an exported OpenVINO IR (``.xml``) model
+
+Kept in step with server/inference.py; the two services deploy separately.
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'int8')  # int8 = quantized export, for the onnx / openvino backends
+
+# Match ultralytics' predict() defaults so every backend reports the same boxes
+DEFAULT_IMGSZ = 640
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+
+
+class UltralyticsDetector:
+    """PyTorch model via ultralytics; keeps only face (or, for generic models, person) classes."""
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+        self.face_classes = [c for c, name in self.names.items() if c == 0 or 'face' in str(name)]
+
+    def __call__(self, images):
+        detections = []
+        for result in self.model(images, verbose=False):
+            boxes = result.boxes.xyxy.cpu().numpy()
+            confidences = result.boxes.conf.cpu().numpy()
+            if result.boxes.cls is not None:
+                keep = np.isin(result.boxes.cls.cpu().numpy().astype(int), self.face_classes)
+                boxes, confidences = boxes[keep], confidences[keep]
+            detections.append((boxes, confidences))
+        return detections
+
+
+class ExportedDetector:
+    """Shared pre/post-processing for exported single-class YOLOv8 face models.
+
+    Input: letterboxed RGB float32 NCHW in [0, 1]. Output: ``(N, 4 + 1 [+ kpts], anchors)``
+    with cx, cy, w, h in letterbox pixels followed by the face score.
+    """
+
+    def __init__(self, imgsz=DEFAULT_IMGSZ, conf=DEFAULT_CONF, iou=DEFAULT_IOU, batch_size=None):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.batch_size = batch_size  # None = dynamic batch axis
+
+    def letterbox(self, image):
+        h, w = image.shape[:2]
+        gain = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        pad_x, pad_y = (self.imgsz - new_w) / 2, (self.imgsz - new_h) / 2
+        if (new_w, new_h) != (w, h):
+            image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, gain, (left, top)
+
+    def preprocess(self, images):
+        blobs, transforms = [], []
+        for image in images:
+            boxed, gain, pad = self.letterbox(image)
+            blobs.append(boxed)
+            transforms.append((gain, pad, image.shape[:2]))
+        # BGR HWC uint8 -> RGB CHW float32 in one vectorised pass over the batch
+        batch = np.stack(blobs)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0, transforms
+
+    def postprocess(self, output, transforms):
+        detections = []
+        for pred, (gain, (pad_x, pad_y), (h, w)) in zip(output, transforms):
+            pred = pred.T  # (anchors, channels)
+            scores = pred[:, 4]
+            keep = scores > self.conf
+            pred, scores = pred[keep], scores[keep]
+
+            boxes = np.empty((len(pred), 4), dtype=np.float32)
+            boxes[:, 0] = pred[:, 0] - pred[:, 2] / 2
+            boxes[:, 1] = pred[:, 1] - pred[:, 3] / 2
+            boxes[:, 2] = pred[:, 0] + pred[:, 2] / 2
+            boxes[:, 3] = pred[:, 1] + pred[:, 3] / 2
+
+            if len(boxes):
+                xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+                indices = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), self.conf, self.iou)
+                indices = np.asarray(indices, dtype=int).reshape(-1)
+                order = indices[np.argsort(-scores[indices])]
+                boxes, scores = boxes[order], scores[order]
+
+            # Undo the letterbox: back to original image pixels
+            boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+            boxes /= gain
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+            detections.append((boxes, scores.astype(np.float32)))
+        return detections
+
+    def forward(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, images):
+        if not images:
+            return []
+        step = self.batch_size or len(images)
+        detections = []
+        for start in range(0, len(images), step):
+            batch, transforms = self.preprocess(images[start:start + step])
+            detections.extend(self.postprocess(self.forward(batch), transforms))
+        return detections
+
+
+class OnnxDetector(ExportedDetector):
+    def __init__(self, model_path, threads=None, **kwargs):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        batch_dim, _, height, _ = model_input.shape
+        kwargs.setdefault('imgsz', height if isinstance(height, int) else DEFAULT_IMGSZ)
+        kwargs.setdefault('batch_size', batch_dim if isinstance(batch_dim, int) else None)
+        super().__init__(**kwargs)
+
+    def forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoDetector(ExportedDetector):
+    def __init__(self, model_path, threads=None, **kwargs):
+        from openvino.runtime import Core
+
+        core = Core()
+        config = {'INFERENCE_NUM_THREADS': threads} if threads else {}
+        model = core.read_model(model_path)
+        self.compiled = core.compile_model(model, 'CPU', config)
+        self.output = self.compiled.output(0)
+
+        input_shape = model.input(0).get_partial_shape()
+        if input_shape[2].is_static:
+            kwargs.setdefault('imgsz', input_shape[2].get_length())
+        if input_shape[0].is_static:
+            kwargs.setdefault('batch_size', input_shape[0].get_length())
+        super().__init__(**kwargs)
+
+    def forward(self, batch):
+        return self.compiled([batch])[self.output]
+
+
+def default_model_path(backend, pt_path, precision='fp32'):
+    """Where ``server/export_model.py`` (or ``quantize_model.py`` for int8) writes the model for ``backend``."""
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown model precision: {precision} (expected one of {", ".join(PRECISIONS)})')
+    if precision == 'int8' and backend == 'ultralytics':
+        raise ValueError('int8 precision needs the onnx or openvino backend')
+
+    stem, _ = os.path.splitext(pt_path)
+    suffix = '' if precision == 'fp32' else f'.{precision}'
+    if backend == 'onnx':
+        return f'{stem}{suffix}.onnx'
+    if backend == 'openvino':
+        folder = f'{stem}_int8_openvino_model' if precision == 'int8' else f'{stem}_openvino_model'
+        return os.path.join(folder, f'{os.path.basename(stem)}.xml')
+    return pt_path
+
+
+def load_detector(backend, model_path, threads=None):
+    if backend == 'ultralytics':
+        return UltralyticsDetector(model_path)
+    if backend == 'onnx':
+        return OnnxDetector(model_path, threads=threads)
+    if backend == 'openvino':
+        return OpenVinoDetector(model_path, threads=threads)
+    raise ValueError(f'Unknown inference backend: {backend} (expected one of {", ".join(BACKENDS)})')
+
+
+def parse_sizes(spec):
+    """``'640x480,1920x1080'`` -> ``[(640, 480), (1920, 1080)]`` (width x height)."""
+    return [tuple(int(v) for v in size.lower().split('x')) for size in spec.split(',') if size.strip()]
+
+
+def warm_up(run, sizes, batch_size=1):
+    """Run synthetic passes so lazy graph setup and allocations happen before real traffic.
+
+    ``run`` has the detector contract (list of BGR images in, detections out). Each
+    ``(width, height)`` gets a single-image pass; the first also gets a full batch.
+    Returns the elapsed seconds.
+    """
+    start = time.perf_counter()
+    for i, (width, height) in enumerate(sizes):
+        image = np.full((height, width, 3), 114, dtype=np.uint8)
+        run([image])
+        if i == 0 and batch_size > 1:
+            run([image] * batch_size)
+    return time.perf_counter() - start
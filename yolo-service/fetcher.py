@@ -0,0 +1,230 @@
+"""
+Image download for the count-students service.
+
+One pooled ``requests.Session`` is shared by every request, so repeat fetches from
+the storage host reuse keep-alive connections. Downloads are streamed with strict
+timeouts and stop as soon as the body passes ``FETCH_MAX_BYTES``; the streamed
+buffer is decoded in place, without another copy of the body.
+
+``FetchCache`` keeps the last download of each URL on disk with its ETag /
+Last-Modified validators and detection result, so repeat verifications of an
+unchanged image cost one conditional GET and no inference.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import requests
+from io import BytesIO
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+FETCH_CONNECT_TIMEOUT = float(os.environ.get('FETCH_CONNECT_TIMEOUT', 3.05))
+FETCH_READ_TIMEOUT = float(os.environ.get('FETCH_READ_TIMEOUT', 10))    # max gap between chunks
+FETCH_TOTAL_TIMEOUT = float(os.environ.get('FETCH_TOTAL_TIMEOUT', 30))  # wall clock for the whole body
+FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_MB', 20)) * 1024 * 1024
+FETCH_POOL_SIZE = int(os.environ.get('FETCH_POOL_SIZE', 16))            # keep-alive connections per host
+CHUNK_SIZE = 64 * 1024
+
+FETCH_CACHE_ENABLED = os.environ.get('FETCH_CACHE', '1') != '0'
+FETCH_CACHE_FOLDER = os.environ.get('FETCH_CACHE_FOLDER', 'fetch_cache')
+FETCH_CACHE_MAX_BYTES = int(os.environ.get('FETCH_CACHE_MAX_MB', 512)) * 1024 * 1024
+
+
+class FetchError(Exception):
+    """Download or decode failure; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def make_session(pool_size=FETCH_POOL_SIZE):
+    session = requests.Session()
+    # Retry connection failures and gateway errors briefly; never retry a slow body
+    retry = Retry(total=2, connect=2, read=0, backoff_factor=0.2,
+                  status_forcelist=(502, 503, 504), allowed_methods=frozenset(['GET', 'HEAD']))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = make_session()
+
+
+def read_body(response, max_bytes=FETCH_MAX_BYTES, deadline=None):
+    """Stream a response body into a bytearray, enforcing the size cap and deadline."""
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise FetchError(f'Image larger than {max_bytes // (1024 * 1024)}MB', 413)
+
+    buffer = bytearray()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise FetchError(f'Image larger than {max_bytes // (1024 * 1024)}MB', 413)
+        if deadline is not None and time.monotonic() > deadline:
+            raise FetchError('Timed out downloading image', 504)
+    return buffer
+
+
+def fetch_image_bytes(url, etag=None, last_modified=None):
+    """GET ``url``; returns ``(body, validators)``.
+
+    With ``etag`` / ``last_modified`` the request is conditional and ``body`` is None
+    when the server answers 304 Not Modified. ``validators`` holds the response's
+    ETag and Last-Modified for the next revalidation.
+    """
+    if not url.startswith(('http://', 'https://')):
+        raise FetchError('imageUrl must be an http(s) URL')
+
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    deadline = time.monotonic() + FETCH_TOTAL_TIMEOUT
+    try:
+        with session.get(url, headers=headers, stream=True,
+                         timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)) as response:
+            if response.status_code == 304 and headers:
+                return None, {'etag': response.headers.get('ETag') or etag,
+                              'last_modified': response.headers.get('Last-Modified') or last_modified}
+            if response.status_code != 200:
+                raise FetchError('Failed to download image')
+            validators = {'etag': response.headers.get('ETag'),
+                          'last_modified': response.headers.get('Last-Modified')}
+            return read_body(response, deadline=deadline), validators
+    except requests.Timeout:
+        raise FetchError('Timed out downloading image', 504)
+    except requests.RequestException as e:
+        raise FetchError(f'Failed to download image: {e.__class__.__name__}', 502)
+
+
+def decode_image(data):
+    """Decode image bytes to a BGR ndarray (OpenCV first, Pillow for formats it lacks)."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        try:
+            image = cv2.cvtColor(np.array(Image.open(BytesIO(data)).convert('RGB')), cv2.COLOR_RGB2BGR)
+        except Exception:
+            raise FetchError('Could not decode image')
+    return image
+
+
+class FetchCache:
+    """URL -> last download cache on disk, evicted least-recently-used past ``max_bytes``.
+
+    Each URL is stored as ``<key>.json`` (validators, content hash, detection result)
+    next to ``<key>.img`` (the downloaded bytes, so a 304 can still be re-detected
+    after a model change).
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'not_modified': 0, 'unchanged_content': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        os.makedirs(folder, exist_ok=True)
+        existing = []
+        for name in os.listdir(folder):
+            key, ext = os.path.splitext(name)
+            if ext == '.json':
+                try:
+                    size = os.path.getsize(self._path(key, '.json')) + os.path.getsize(self._path(key, '.img'))
+                    existing.append((os.path.getmtime(self._path(key, '.json')), key, size))
+                except OSError:
+                    continue
+        for _, key, size in sorted(existing):
+            self._sizes[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.folder, key + ext)
+
+    def get(self, url):
+        """Cached entry for ``url`` (validators, content_hash, model, result) or None."""
+        key = self.key(url)
+        with self._lock:
+            if key not in self._sizes:
+                self.stats['misses'] += 1
+                return None
+            self._sizes.move_to_end(key)
+        try:
+            with open(self._path(key, '.json')) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        return entry if entry.get('url') == url else None
+
+    def read_image(self, url):
+        """The cached download for ``url``, or None if it has been evicted meanwhile."""
+        try:
+            with open(self._path(self.key(url), '.img'), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def record_hit(self, kind):
+        with self._lock:
+            self.stats[kind] += 1
+
+    def put(self, url, data, entry):
+        """Store the download and its entry; ``data=None`` updates the entry only."""
+        key = self.key(url)
+        entry = {**entry, 'url': url, 'validated_at': time.time()}
+        # Unique temp names: concurrent requests for the same URL each write their own
+        suffix = f'.{uuid.uuid4().hex}.tmp'
+        if data is not None:
+            tmp_path = self._path(key, '.img' + suffix)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key, '.img'))
+        tmp_path = self._path(key, '.json' + suffix)
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key, '.json'))
+
+        try:
+            size = os.path.getsize(self._path(key, '.json')) + os.path.getsize(self._path(key, '.img'))
+        except OSError:
+            return
+        with self._lock:
+            self.total_bytes += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            self.stats['stores'] += 1
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._sizes) > 1:
+                old_key, old_size = self._sizes.popitem(last=False)
+                self.total_bytes -= old_size
+                self.stats['evictions'] += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            for ext in ('.json', '.img'):
+                try:
+                    os.remove(self._path(old_key, ext))
+                except OSError:
+                    pass
+
+    def info(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._sizes), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
@@ -0,0 +1,177 @@
+"""
+Load test for minimal_service.py (or any /count-students server), stdlib only.
+
+    # Start both server modes locally and compare them side by side
+    python load_test.py --spawn --concurrency 1,8,32,64 --slow-clients 2
+    # Or drive an already running service
+    python load_test.py --url http://localhost:8080 --concurrency 1,16,64
+
+Each client thread keeps one connection open (keep-alive) and re-connects when the
+server closes it. --slow-clients N adds N clients that trickle a request body for
+the whole run, which is what stalls the single-threaded server.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+BODY = json.dumps({'imageUrl': 'http://localhost/test_image.jpg'}).encode()
+HEADERS = {'Content-Type': 'application/json'}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def client_loop(host, port, path, deadline, latencies, errors, lock):
+    conn = None
+    while time.perf_counter() < deadline:
+        if conn is None:
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        start = time.perf_counter()
+        try:
+            conn.request('POST', path, body=BODY, headers=HEADERS)
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(response.status)
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            with lock:
+                errors.append(type(e).__name__)
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def slow_client(host, port, path, deadline):
+    """Send headers, then one body byte at a time until the run ends."""
+    try:
+        sock = socket.create_connection((host, port), timeout=30)
+        sock.sendall(f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(BODY)}\r\n\r\n'.encode())
+        for byte in BODY:
+            if time.perf_counter() >= deadline:
+                break
+            sock.sendall(bytes([byte]))
+            time.sleep(0.5)
+        sock.close()
+    except OSError:
+        pass
+
+
+def run_level(url, concurrency, duration, slow_clients):
+    parsed = urllib.parse.urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    path = parsed.path if parsed.path not in ('', '/') else '/count-students'
+
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=slow_client, args=(host, port, path, deadline), daemon=True)
+               for _ in range(slow_clients)]
+    threads += [threading.Thread(target=client_loop, args=(host, port, path, deadline, latencies, errors, lock),
+                                 daemon=True)
+                for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads[slow_clients:]:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'concurrency': concurrency,
+        'slow_clients': slow_clients,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(mode):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), SERVER_MODE=mode)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'minimal_service.py')
+    process = subprocess.Popen([sys.executable, script], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, f'http://127.0.0.1:{port}/count-students'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Requests/sec and p99 vs concurrency for /count-students')
+    parser.add_argument('--url', default='http://localhost:8080/count-students')
+    parser.add_argument('--spawn', action='store_true',
+                        help='start minimal_service.py in single and threaded mode and compare them')
+    parser.add_argument('--concurrency', default='1,8,32,64', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per concurrency level')
+    parser.add_argument('--slow-clients', type=int, default=0, help='clients trickling a request body')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    targets = {}
+    processes = []
+    if args.spawn:
+        for mode in ('single', 'threaded'):
+            process, url = spawn_server(mode)
+            processes.append(process)
+            targets[mode] = url
+    else:
+        targets['target'] = args.url
+
+    results = {}
+    try:
+        print(f"{'server':10} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, url in targets.items():
+            results[name] = []
+            for concurrency in levels:
+                row = run_level(url, concurrency, args.duration, args.slow_clients)
+                results[name].append(row)
+                print(f"{name:10} {concurrency:5d} {row['rps']:9.1f} {row['p50_ms']:9.2f} "
+                      f"{row['p99_ms']:9.2f} {row['errors']:7d}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved results to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
 
 """
 Minimal HTTP server for YOLO mock service using only built-in Python modules
+
+SERVER_MODE=threaded (default) serves connections from a bounded thread pool with
+HTTP/1.1 keep-alive; SERVER_MODE=single is the original one-request-at-a-time server.
 """
 
 import http.server
 import socketserver
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
 import urllib.request
 import random
@@ -13,36 +18,48 @@ import base64
 import io
 import os
 
+SERVER_MODE = os.environ.get('SERVER_MODE', 'threaded')        # threaded | single
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 32))            # threads serving connections
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 128))       # open connections (running + queued); 503 beyond
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 5))  # idle/slow socket timeout in seconds
+
 class YOLOHandler(http.server.BaseHTTPRequestHandler):
+    def setup(self):
+        # Keep-alive (and a socket timeout so idle or slow clients can't pin a worker) in threaded mode
+        if SERVER_MODE == 'threaded':
+            self.protocol_version = 'HTTP/1.1'
+            self.timeout = KEEPALIVE_TIMEOUT
+            self.disable_nagle_algorithm = True  # headers and body go out as separate writes
+        super().setup()
+
+    def end_headers(self):
+        # When connections are waiting for a worker, don't let this one sit idle in keep-alive
+        if isinstance(self.server, BoundedThreadPoolServer) and self.server.saturated():
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
     def do_GET(self):
         if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
             response = {'status': 'healthy', 'service': 'minimal-yolo-mock'}
-            self.wfile.write(json.dumps(response).encode())
+            if isinstance(self.server, BoundedThreadPoolServer):
+                response['server'] = self.server.info()
+            self.send_json(response, 200)
         
         elif self.path == '/test':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
             response = {
                 'message': 'Minimal YOLO Mock Service is running',
                 'endpoints': ['/health', '/count-students', '/test'],
                 'status': 'ready'
             }
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(response, 200)
         
         else:
-            self.send_response(404)
-            self.end_headers()
+            self.send_empty(404)
     
     def do_POST(self):
         if self.path == '/count-students':
             try:
-                content_length = int(self.headers['Content-Length'])
+                content_length = int(self.headers.get('Content-Length', 0))
                 post_data = self.rfile.read(content_length)
                 data = json.loads(post_data.decode('utf-8'))
                 
@@ -85,11 +102,7 @@ class YOLOHandler(http.server.BaseHTTPRequestHandler):
                     'message': f'Mock detection found {face_count} faces'
                 }
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
+                self.send_json(result, 200)
                 
                 print(f"Returned mock result: {face_count} faces detected")
                 
@@ -98,8 +111,7 @@ class YOLOHandler(http.server.BaseHTTPRequestHandler):
                 self.send_error_response({'error': f'Failed to process image: {str(e)}'}, 500)
         
         else:
-            self.send_response(404)
-            self.end_headers()
+            self.send_empty(404)
     
     def do_OPTIONS(self):
         # Handle CORS preflight requests
@@ -107,18 +119,102 @@ class YOLOHandler(http.server.BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
-    def send_error_response(self, error_data, status_code):
+    def send_json(self, data, status_code):
+        # Content-Length on every response so keep-alive clients know where it ends
+        body = json.dumps(data).encode()
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status_code):
+        self.send_response(status_code)
+        self.send_header('Content-Length', '0')
         self.end_headers()
-        self.wfile.write(json.dumps(error_data).encode())
+
+    def send_error_response(self, error_data, status_code):
+        self.send_json(error_data, status_code)
+
+class BoundedThreadPoolServer(http.server.HTTPServer):
+    """HTTP server that hands each connection to a fixed-size thread pool.
+
+    Connections beyond MAX_IN_FLIGHT (running + waiting for a worker) are answered
+    with 503 straight away instead of queueing without bound.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers, max_in_flight):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            self._reject(request)
+            return
+        with self._lock:
+            self.in_flight += 1
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def saturated(self):
+        return self.in_flight > self.max_workers
+
+    def _reject(self, request):
+        body = json.dumps({'error': 'Server busy, retry later'}).encode()
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                            b'Content-Type: application/json\r\n'
+                            b'Retry-After: 1\r\n'
+                            b'Connection: close\r\n'
+                            b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def info(self):
+        with self._lock:
+            return {'mode': 'threaded', 'max_workers': self.max_workers, 'max_in_flight': self.max_in_flight,
+                    'in_flight': self.in_flight, 'rejected': self.rejected}
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+def make_server(port):
+    if SERVER_MODE == 'single':
+        return socketserver.TCPServer(("", port), YOLOHandler)
+    return BoundedThreadPoolServer(("", port), YOLOHandler, MAX_WORKERS, MAX_IN_FLIGHT)
 
 def run_server(port=8080):
-    with socketserver.TCPServer(("", port), YOLOHandler) as httpd:
-        print(f"Minimal YOLO Mock Service running on port {port}")
+    with make_server(port) as httpd:
+        print(f"Minimal YOLO Mock Service running on port {port} ({SERVER_MODE} mode)")
+        if SERVER_MODE == 'threaded':
+            print(f"  {MAX_WORKERS} workers, max {MAX_IN_FLIGHT} connections in flight, keep-alive {KEEPALIVE_TIMEOUT}s")
         print("Available endpoints:")
         print("  GET  /health - Health check")
         print("  POST /count-students - Face detection (mock)")